@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT / "dashboard"))
+
+import utils.certs_utils as certs_utils  # noqa: E402
+
+
+DEFAULT_RUNS = 5
+MODES = ("openssl-rsa4096", "rsa4096", "rsa4096-pool", "ec-p256")
+
+
+def make_ca(workdir):
+    ca_dir = workdir / "ssl"
+    env = dict(os.environ, CA_DIR=str(ca_dir))
+    subprocess.run(["bash", str(ROOT / "scripts" / "gen_certs.sh")], cwd=workdir, env=env, check=True, capture_output=True)
+    return ca_dir
+
+
+def point_to(ca_dir):
+    certs_utils.CA_PATH = ca_dir / "ca"
+    certs_utils.CLIENTS_PATH = ca_dir / "clients"
+    certs_utils.CLIENTS_JSON_PATH = certs_utils.CLIENTS_PATH / "clients.json"
+    certs_utils.CERTS_LOGPATH = str(ca_dir / "certs.log")
+    certs_utils.CLIENTS_JSON_PATH.write_text(json.dumps({"clients": []}))
+
+
+def fill_pool(count):
+    # Enche o pool antes de medir, como o serviço faria em segundo plano
+    pool = certs_utils.KeyPool(size=count, low=0, key_types=("rsa",))
+    start = time.perf_counter()
+    for _ in range(count):
+        pool._generate("rsa")
+    certs_utils.key_pool = pool
+    return time.perf_counter() - start
+
+
+def issue(mode, name):
+    if mode == "openssl-rsa4096":
+        return certs_utils.add_client_cert_openssl(name, "bench")
+    key_type = "ec" if mode == "ec-p256" else "rsa"
+    return certs_utils.add_client_cert(name, "bench", key_type)
+
+
+def verify(ca_dir, name):
+    client = certs_utils.CLIENTS_PATH / name
+    subprocess.run(
+        ["openssl", "verify", "-CAfile", str(ca_dir / "ca" / "ca.crt"), str(client / "client.crt")],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        ["openssl", "pkcs12", "-in", str(client / "client.p12"), "-passin", "pass:bench", "-noout"],
+        check=True,
+        capture_output=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara a emissão de certificados de cliente")
+    parser.add_argument("--execucoes", type=int, default=DEFAULT_RUNS, help="certificados emitidos por modo")
+    parser.add_argument("--modos", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--manter", action="store_true", help="não apaga a CA e os certificados gerados")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="primis-certs-"))
+    try:
+        ca_dir = make_ca(workdir)
+        point_to(ca_dir)
+
+        results = {}
+        for mode in args.modos:
+            # Sem pool nos outros modos: a chave é gerada dentro da emissão
+            certs_utils.key_pool = certs_utils.KeyPool(size=0, key_types=())
+            fill_s = fill_pool(args.execucoes) if mode == "rsa4096-pool" else None
+
+            durations = []
+            for i in range(args.execucoes):
+                name = f"{mode}-{i}"
+                start = time.perf_counter()
+                issue(mode, name)
+                durations.append(time.perf_counter() - start)
+                verify(ca_dir, name)
+
+            results[mode] = {
+                "median_s": round(statistics.median(durations), 4),
+                "min_s": round(min(durations), 4),
+                "max_s": round(max(durations), 4),
+                "per_minute": round(60 / statistics.fmean(durations), 1),
+            }
+            if fill_s is not None:
+                results[mode]["pool_fill_s"] = round(fill_s, 3)
+
+        report = {"execucoes": args.execucoes, "results": results}
+    finally:
+        if not args.manter:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
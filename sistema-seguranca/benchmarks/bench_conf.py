@@ -0,0 +1,110 @@
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from bench_proxy import (  # noqa: E402
+    Nginx,
+    free_port,
+    make_pki,
+    nginx_utils,
+    route_paths,
+    run_load,
+    start_stub,
+    write_nginx_conf,
+    write_routes,
+)
+
+
+DEFAULT_ROUTE_COUNTS = (10, 100, 1000, 5000)
+TEST_RUNS = 3
+
+
+def generation(mode, paths):
+    generator = nginx_utils.CONF_GENERATORS[mode]
+    start = time.perf_counter()
+    conf = generator(paths)
+    return time.perf_counter() - start, conf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara os geradores do protected_routes.conf")
+    parser.add_argument("--nginx", default=shutil.which("nginx"))
+    parser.add_argument("--naxsi-module", default="/usr/lib/nginx/modules/ngx_http_naxsi_module.so")
+    parser.add_argument("--naxsi-core", default="/etc/nginx/naxsi_core.rules")
+    parser.add_argument("--mime-types", default="/etc/nginx/mime.types")
+    parser.add_argument("--rotas", type=int, nargs="+", default=DEFAULT_ROUTE_COUNTS)
+    parser.add_argument("--modos", nargs="+", default=sorted(nginx_utils.CONF_GENERATORS))
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--duracao", type=float, default=3.0, help="segundos de carga mTLS por cenário (0 desliga)")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--manter", action="store_true", help="não apaga o diretório temporário")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="primis-conf-"))
+    (workdir / "logs").mkdir()
+    stub = start_stub() if args.nginx else None
+    port = free_port()
+
+    try:
+        if args.nginx:
+            _, client_dir = make_pki(workdir)
+            naxsi_module = args.naxsi_module if Path(args.naxsi_module).exists() else None
+            naxsi_core = args.naxsi_core if Path(args.naxsi_core).exists() else None
+            mime_types = args.mime_types if Path(args.mime_types).exists() else None
+            # Sem limit_req: toda a carga vem do mesmo IP
+            naxsi = write_nginx_conf(workdir, port, stub.server_address[1], naxsi_module, naxsi_core, mime_types, False)
+            nginx = Nginx(args.nginx, workdir, port)
+
+        scenarios = {}
+        for count in args.rotas:
+            paths = route_paths(count)
+            scenarios[str(count)] = by_mode = {}
+
+            for mode in args.modos:
+                gen_s, conf = generation(mode, paths)
+                result = by_mode[mode] = {
+                    "config_bytes": len(conf.encode()),
+                    "locations": conf.count("location "),
+                    "generation_s": round(gen_s, 4),
+                }
+                if not args.nginx:
+                    continue
+
+                write_routes(workdir, count, stub.server_address[1], naxsi, False, mode)
+                result["nginx_t_s"] = round(statistics.median(nginx.test() for _ in range(TEST_RUNS)), 4)
+                if args.duracao > 0:
+                    nginx.start()
+                    try:
+                        # Só requisições mTLS na última rota, o pior caso da busca
+                        load = run_load(port, client_dir, {"mtls": 1}, paths, args.concorrencia, args.duracao)
+                    finally:
+                        nginx.stop()
+                    result.update({key: load[key] for key in ("rps", "p50_ms", "p99_ms", "mean_ms", "status")})
+
+        report = {
+            "nginx": args.nginx,
+            "rotas": scenarios,
+        }
+    finally:
+        if stub:
+            stub.shutdown()
+        if not args.manter:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT / "dashboard"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from gen_logs import access_lines, write_logs  # noqa: E402
+
+
+DEFAULT_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
+WARM_RUNS = 5
+APPEND_LINES = 1000
+
+
+def git_version():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def fake_supervisorctl(directory):
+    # Fora do container não existe supervisord; o /configurar só precisa da
+    # saída do "status"
+    bin_dir = directory / "bin"
+    bin_dir.mkdir(exist_ok=True)
+    script = bin_dir / "supervisorctl"
+    script.write_text("#!/bin/sh\necho 'nginx RUNNING pid 1, uptime 0:00:01'\n")
+    script.chmod(0o755)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+def point_to(directory):
+    # Aponta os módulos do painel para os logs gerados em vez de /var/log
+    import utils.log_utils as log_utils
+
+    log_utils.start_ingestion = lambda *args, **kwargs: None
+
+    import utils.events_utils as events_utils
+    import utils.nginx_utils as nginx_utils
+    import utils.fail2ban_utils as fail2ban_utils
+    import utils.certs_utils as certs_utils
+    import utils.naxsi_utils as naxsi_utils
+
+    events_utils.EVENTS_DB_PATH = directory / "events.db"
+
+    nginx = directory / "nginx"
+    nginx_utils.NGINX_LOGS_PATH = nginx
+    nginx_utils.NGINX_ERROR_PATH = nginx / "error.log"
+    nginx_utils.NGINX_NORMAL_ACCESS = nginx / "normal_access.log"
+    nginx_utils.NGINX_NORMAL_ERROR = nginx / "normal_error.log"
+    nginx_utils.NGINX_PROTECTED_ACCESS = nginx / "protected_access.log"
+    nginx_utils.NGINX_PROTECTED_ERROR = nginx / "protected_error.log"
+    nginx_utils.NGINX_JSON_ROUTES_PATH = directory / "protected_routes.json"
+    nginx_utils.NGINX_CONF_PATH = directory / "protected_routes.conf"
+    (directory / "protected_routes.json").write_text(json.dumps({"protected_routes": ["/interface/login"]}))
+
+    fail2ban_utils.FAIL2BAN_LOG_PATH = directory / "fail2ban-actions.log"
+    certs_utils.CERTS_LOGPATH = directory / "certs.log"
+    certs_utils.CLIENTS_PATH = directory / "clients"
+    certs_utils.CLIENTS_JSON_PATH = directory / "clients" / "clients.json"
+    certs_utils.CLIENTS_PATH.mkdir(exist_ok=True)
+    certs_utils.CLIENTS_JSON_PATH.write_text(json.dumps({"clients": ["recepcao", "financeiro"]}))
+
+    naxsi_utils.MAIN_RULES = directory / "naxsi.rules"
+    shutil.copy(ROOT / "data" / "naxsi" / "naxsi.rules", naxsi_utils.MAIN_RULES)
+
+    paths = {
+        "normal_access": nginx_utils.NGINX_NORMAL_ACCESS,
+        "normal_errors": nginx_utils.NGINX_NORMAL_ERROR,
+        "protected_access": nginx_utils.NGINX_PROTECTED_ACCESS,
+        "protected_errors": nginx_utils.NGINX_PROTECTED_ERROR,
+        "server_errors": nginx_utils.NGINX_ERROR_PATH,
+        "fail2ban": fail2ban_utils.FAIL2BAN_LOG_PATH,
+        "certs": certs_utils.CERTS_LOGPATH,
+    }
+    for name, path in paths.items():
+        log_utils.get_follower(name).filepath = str(path)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def append_access(directory, count=APPEND_LINES):
+    with open(directory / "nginx" / "normal_access.log", "a") as f:
+        f.writelines(access_lines(count, span=60, seed=time.time_ns()))
+
+
+def run_worker(directory):
+    directory = Path(directory)
+    fake_supervisorctl(directory)
+    point_to(directory)
+
+    import app as dashboard_app
+    from utils.nginx_utils import get_dict_logs, get_insights
+    from utils.fail2ban_utils import get_fail2ban_logs
+    from utils.certs_utils import get_certs_logs
+
+    client = dashboard_app.app.test_client()
+
+    def route(path):
+        def call():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} retornou {response.status_code}")
+        return call
+
+    targets = {
+        "get_dict_logs": (get_dict_logs, get_dict_logs.__wrapped__),
+        "get_insights": (lambda: get_insights("24h"), lambda: get_insights.__wrapped__("24h")),
+        "get_fail2ban_logs": (get_fail2ban_logs, get_fail2ban_logs.__wrapped__),
+        "get_certs_logs": (get_certs_logs, get_certs_logs.__wrapped__),
+        "GET /": (route("/"), None),
+        "GET /configurar": (route("/configurar"), None),
+    }
+
+    results = {}
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for name, (fn, uncached) in targets.items():
+        cold = timed(fn)
+        warm = [timed(fn) for _ in range(WARM_RUNS)]
+        append_access(directory)
+        after_append = timed(fn)
+
+        results[name] = {
+            "cold_s": round(cold, 6),
+            "warm_median_s": round(statistics.median(warm), 6),
+            "after_append_s": round(after_append, 6),
+            "uncached_peak_bytes": peak_memory(uncached or fn),
+        }
+
+    results["_process"] = {
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+        "log_bytes": sum(p.stat().st_size for p in directory.rglob("*.log")),
+    }
+    print(json.dumps(results))
+
+
+def run_size(size, keep):
+    directory = Path(tempfile.mkdtemp(prefix=f"primis-bench-{size}-"))
+    try:
+        start = time.perf_counter()
+        write_logs(directory, size)
+        generation = time.perf_counter() - start
+
+        worker = subprocess.run(
+            [sys.executable, __file__, "--worker", str(directory)],
+            capture_output=True,
+            text=True,
+        )
+        if worker.returncode != 0:
+            return {"error": worker.stderr.strip().splitlines()[-1:]}
+
+        result = json.loads(worker.stdout.strip().splitlines()[-1])
+        result["_process"]["generation_s"] = round(generation, 3)
+        return result
+    finally:
+        if not keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede tempo e memória do caminho de leitura do painel")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=DEFAULT_SIZES, help="linhas do normal_access.log")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--manter", action="store_true", help="não apaga os logs gerados")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+        return
+
+    report = {
+        "version": git_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": int(time.time()),
+        "results": {str(size): run_size(size, args.manter) for size in args.tamanhos},
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
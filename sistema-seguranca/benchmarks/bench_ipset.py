@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+DEFAULT_BAN_COUNTS = (0, 1000, 10000, 50000)
+MODES = ("regras", "ipset")
+DEFAULT_PACKETS = 200000
+PORT = 9999
+SET_NAME = "primis-ban"
+
+
+def banned_ips(count, seed=1):
+    # Faixa 100.64.0.0/10: nunca é a origem dos pacotes do teste (127.0.0.1),
+    # então todo pacote percorre a lista inteira no modo "regras"
+    rng = random.Random(seed)
+    ips = set()
+    while len(ips) < count:
+        ips.add(f"100.{rng.randint(64, 127)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}")
+    return sorted(ips)
+
+
+def netns(name, *cmd, **kwargs):
+    return subprocess.run(["ip", "netns", "exec", name, *cmd], check=True, capture_output=True, text=True, **kwargs)
+
+
+def load_rules(name, mode, ips):
+    if mode == "regras":
+        # Mesmo formato do iptables-multiport: uma regra por IP banido
+        rules = ["*filter", ":INPUT ACCEPT [0:0]"]
+        rules += [f"-A INPUT -s {ip}/32 -p udp -m multiport --dports {PORT} -j REJECT" for ip in ips]
+        rules.append("COMMIT")
+        netns(name, "iptables-restore", input="\n".join(rules) + "\n")
+        return
+
+    # Mesmo formato do action.d/ipset-ban.conf: um conjunto e uma regra
+    entries = [f"create {SET_NAME} hash:ip timeout 0 maxelem 1048576"]
+    entries += [f"add {SET_NAME} {ip} timeout 600" for ip in ips]
+    netns(name, "ipset", "restore", input="\n".join(entries) + "\n")
+    netns(
+        name, "iptables", "-w", "-I", "INPUT", "-p", "udp", "-m", "multiport", "--dports", str(PORT),
+        "-m", "set", "--match-set", SET_NAME, "src", "-j", "REJECT",
+    )
+
+
+def run_worker(packets):
+    # Dentro do namespace: manda pacotes UDP pelo loopback e mede quanto
+    # tempo o kernel leva para entregá-los depois de passar pelo INPUT
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    receiver.bind(("127.0.0.1", PORT))
+    receiver.settimeout(1.0)
+    payload = b"x" * 64
+    received = 0
+
+    def send():
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for _ in range(packets):
+            try:
+                sender.sendto(payload, ("127.0.0.1", PORT))
+            except OSError:
+                pass
+        sender.close()
+
+    thread = threading.Thread(target=send)
+    start = time.perf_counter()
+    thread.start()
+    last = start
+    try:
+        while received < packets:
+            receiver.recv(128)
+            received += 1
+            last = time.perf_counter()
+    except socket.timeout:
+        pass
+    thread.join()
+
+    elapsed = last - start
+    print(json.dumps({
+        "enviados": packets,
+        "recebidos": received,
+        "pps": round(received / elapsed, 1) if elapsed else None,
+        "ns_por_pacote": round(elapsed / received * 1e9, 1) if received else None,
+    }))
+
+
+def run_case(mode, count, packets):
+    name = f"primis-bench-{os.getpid()}"
+    subprocess.run(["ip", "netns", "add", name], check=True, capture_output=True)
+    try:
+        netns(name, "ip", "link", "set", "lo", "up")
+        ips = banned_ips(count)
+        start = time.perf_counter()
+        if count or mode == "ipset":
+            load_rules(name, mode, ips)
+        load_s = time.perf_counter() - start
+
+        worker = netns(name, sys.executable, __file__, "--worker", "--pacotes", str(packets))
+        result = json.loads(worker.stdout.strip().splitlines()[-1])
+        result["carga_regras_s"] = round(load_s, 3)
+        return result
+    finally:
+        subprocess.run(["ip", "netns", "del", name], capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo por pacote de uma regra por IP banido contra um conjunto ipset")
+    parser.add_argument("--banidos", type=int, nargs="+", default=DEFAULT_BAN_COUNTS)
+    parser.add_argument("--modos", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--pacotes", type=int, default=DEFAULT_PACKETS)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.pacotes)
+        return
+
+    missing = [tool for tool in ("ip", "iptables", "iptables-restore", "ipset") if shutil.which(tool) is None]
+    if missing or os.geteuid() != 0:
+        sys.exit(f"Precisa de root e de {', '.join(missing) or 'ip, iptables e ipset'} (rode dentro do container)")
+
+    report = {
+        "pacotes": args.pacotes,
+        "results": {
+            mode: {str(count): run_case(mode, count, args.pacotes) for count in args.banidos}
+            for mode in args.modos
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
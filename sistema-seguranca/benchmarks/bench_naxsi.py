@@ -0,0 +1,93 @@
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT / "dashboard"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from gen_logs import error_lines, write_lines  # noqa: E402
+from utils.naxsi_utils import NXUTIL_PATH, NaxsiLearner  # noqa: E402
+
+
+DEFAULT_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
+APPEND_LINES = 1000
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def nxutil(log_path):
+    return subprocess.run(
+        ["python3", NXUTIL_PATH, "-l", str(log_path), "-o", "-p", "1"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.splitlines()
+
+
+def run_size(directory, size, with_nxutil):
+    log_path = directory / f"normal_error_{size}.log"
+    state_path = directory / f"naxsi_{size}.json"
+    write_lines(log_path, error_lines(size))
+
+    learner = NaxsiLearner(log_path, state_path)
+    result = {"log_bytes": log_path.stat().st_size}
+
+    result["full_update_s"], _ = timed(learner.update)
+    result["whitelist_s"], rules = timed(learner.whitelist)
+    result["rules"] = sum(1 for line in rules if line.startswith("BasicRule"))
+    result["noop_update_s"], _ = timed(learner.update)
+
+    with open(log_path, "a") as f:
+        f.writelines(error_lines(APPEND_LINES, span=60, seed=time.time_ns()))
+    result["append_update_s"], _ = timed(learner.update)
+
+    # Processo novo: carrega o estado salvo em vez de reler o log
+    restarted = NaxsiLearner(log_path, state_path)
+    result["restart_update_s"], _ = timed(restarted.update)
+    result["state_bytes"] = state_path.stat().st_size
+
+    if with_nxutil:
+        result["nxutil_s"], reference = timed(lambda: nxutil(log_path))
+        result["nxutil_rules"] = sum(1 for line in reference if line.startswith("BasicRule"))
+
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o aprendizado incremental do NAXSI com o nx_util")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=DEFAULT_SIZES, help="linhas do normal_error.log")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--manter", action="store_true", help="não apaga os arquivos gerados")
+    args = parser.parse_args()
+
+    with_nxutil = Path(NXUTIL_PATH).exists()
+    directory = Path(tempfile.mkdtemp(prefix="primis-naxsi-"))
+    try:
+        report = {
+            "nxutil": with_nxutil,
+            "results": {str(size): run_size(directory, size, with_nxutil) for size in args.tamanhos},
+        }
+    finally:
+        if not args.manter:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "dashboard"))
+
+from utils.nginx_utils import parse_access_batch, parse_nginx_access  # noqa: E402
+
+
+# Implementação anterior, mantida aqui só como referência de comparação
+
+
+def legacy_parse_nginx_access(line):
+    pattern = r'^(\d+\.\d+\.\d+\.\d+) .* \[(.*?)\] "(.*?) (.*?) HTTP\/.*?" (\d+) \d+ ".*?" "(.*?)"$'
+    match = re.match(pattern, line)
+    if not match:
+        return None
+
+    return {
+        "ip": match.group(1),
+        "date": match.group(2),
+        "method": match.group(3),
+        "url": match.group(4),
+        "status": int(match.group(5)),
+        "user_agent": match.group(6),
+        "is_error": int(match.group(5)) >= 400,
+    }
+
+
+def legacy_timestamps(records):
+    return [datetime.strptime(r["date"], "%d/%b/%Y:%H:%M:%S %z").timestamp() for r in records if r]
+
+
+def generate_lines(count):
+    tz = timezone(timedelta(hours=-3))
+    start = datetime.now(tz=tz) - timedelta(seconds=count)
+    lines = []
+    for i in range(count):
+        date = (start + timedelta(seconds=i)).strftime("%d/%b/%Y:%H:%M:%S %z")
+        ip = f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+        status = random.choice((200, 200, 200, 302, 404, 403, 500))
+        lines.append(f'{ip} - - [{date}] "GET /interface/login.php?id={i} HTTP/1.1" {status} 512 "-" "Mozilla/5.0"\n')
+    return lines
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o parser de acesso por linha com o parser em lote")
+    parser.add_argument("--linhas", type=int, default=200000)
+    args = parser.parse_args()
+
+    lines = generate_lines(args.linhas)
+
+    legacy, t_legacy_parse = timed(lambda: [legacy_parse_nginx_access(line) for line in lines])
+    _, t_legacy_ts = timed(legacy_timestamps, legacy)
+    wrapped, t_wrapped = timed(lambda: [parse_nginx_access(line) for line in lines])
+    batch, t_batch = timed(parse_access_batch, lines)
+    _, t_records = timed(batch.records)
+
+    assert len(batch) == len([r for r in legacy if r])
+    assert [r["ts"] for r in wrapped] == [int(ts) for ts in legacy_timestamps(legacy)]
+
+    print(json.dumps({
+        "linhas": args.linhas,
+        "legado_parse_s": round(t_legacy_parse, 4),
+        "legado_parse_strptime_s": round(t_legacy_parse + t_legacy_ts, 4),
+        "wrapper_por_linha_s": round(t_wrapped, 4),
+        "lote_colunar_s": round(t_batch, 4),
+        "lote_com_registros_s": round(t_batch + t_records, 4),
+        "ganho_lote": round((t_legacy_parse + t_legacy_ts) / t_batch, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT / "dashboard"))
+
+import utils.nginx_utils as nginx_utils  # noqa: E402
+
+
+DEFAULT_ROUTE_COUNTS = (0, 10, 100, 1000)
+DEFAULT_MIX = {"benigno": 0.7, "malicioso": 0.2, "mtls": 0.1}
+
+BENIGN_PATHS = (
+    "/",
+    "/interface/login/login.php?site=default",
+    "/interface/main/tabs/main.php",
+    "/portal/index.php",
+)
+MALICIOUS_PATHS = (
+    "/interface/login/login.php?id=1%27%20OR%20%271%27=%271",
+    "/portal/index.php?q=%3Cscript%3Ealert(1)%3C/script%3E",
+    "/interface/../../../../etc/passwd",
+    "/portal/index.php?id=1%20UNION%20SELECT%20password%20FROM%20users--",
+)
+
+
+# Upstream falso no lugar do openemr:80
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# CA descartável e certificado de cliente para o mTLS
+
+
+def make_pki(workdir):
+    ca_dir = workdir / "ssl"
+    env = dict(os.environ, CA_DIR=str(ca_dir))
+    subprocess.run(["bash", str(ROOT / "scripts" / "gen_certs.sh")], cwd=workdir, env=env, check=True, capture_output=True)
+
+    client = ca_dir / "clients" / "bench"
+    client.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["openssl", "genrsa", "-out", str(client / "client.key"), "2048"], check=True, capture_output=True)
+    subprocess.run(
+        ["openssl", "req", "-new", "-key", str(client / "client.key"), "-out", str(client / "client.csr"), "-subj", "/CN=bench"],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        [
+            "openssl", "x509", "-req", "-days", "1", "-in", str(client / "client.csr"),
+            "-CA", str(ca_dir / "ca" / "ca.crt"), "-CAkey", str(ca_dir / "ca" / "ca.key"),
+            "-CAcreateserial", "-out", str(client / "client.crt"),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return ca_dir, client
+
+
+# Configuração do nginx apontada para o diretório temporário
+
+
+def route_paths(count):
+    return [f"/modulo{i}/recurso" for i in range(count)]
+
+
+def rewrite_paths(text, workdir, upstream_port, naxsi, limit_req=True):
+    replacements = {
+        "/var/log/nginx": str(workdir / "logs"),
+        "/var/run/nginx.pid": str(workdir / "nginx.pid"),
+        "/etc/ssl/server": str(workdir / "ssl"),
+        "/etc/nginx/": f"{workdir}/",
+        "http://openemr:80": f"http://127.0.0.1:{upstream_port}",
+    }
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+    if not naxsi:
+        text = re.sub(r"^\s*(include \S*naxsi\S*\.rules;|load_module \S*naxsi\S*;)\s*$", "", text, flags=re.M)
+    if not limit_req:
+        # Toda a carga sai de 127.0.0.1, então os limites por IP dominariam o resultado
+        text = re.sub(r"^\s*limit_req .*;\s*$", "", text, flags=re.M)
+    return text
+
+
+def write_nginx_conf(workdir, port, upstream_port, naxsi_module, naxsi_core, mime_types, limit_req=True):
+    conf = (ROOT / "data" / "nginx" / "nginx.conf").read_text()
+    conf = re.sub(r"^user .*;$", "", conf, flags=re.M)
+    conf = conf.replace("listen 443 ssl;", f"listen 127.0.0.1:{port} ssl;")
+    conf = conf.replace("load_module modules/ngx_http_naxsi_module.so;", f"load_module {naxsi_module};" if naxsi_module else "")
+
+    # Os includes de /etc/nginx passam a apontar para cópias no diretório temporário
+    if mime_types:
+        shutil.copy(mime_types, workdir / "mime.types")
+    else:
+        conf = conf.replace("include /etc/nginx/mime.types;", "")
+
+    naxsi = bool(naxsi_module and naxsi_core)
+    if naxsi:
+        shutil.copy(naxsi_core, workdir / "naxsi_core.rules")
+        rules = (ROOT / "data" / "naxsi" / "naxsi.rules").read_text()
+        (workdir / "naxsi.rules").write_text(rewrite_paths(rules, workdir, upstream_port, naxsi))
+        (workdir / "generated.wl").write_text("")
+
+    (workdir / "nginx.conf").write_text(rewrite_paths(conf, workdir, upstream_port, naxsi, limit_req))
+    return naxsi
+
+
+def write_routes(workdir, count, upstream_port, naxsi, limit_req=True, mode=None):
+    nginx_utils.NGINX_CONF_PATH = str(workdir / "protected_routes.raw")
+    nginx_utils.create_conf_file(route_paths(count), mode)
+    raw = (workdir / "protected_routes.raw").read_text()
+    conf = rewrite_paths(raw, workdir, upstream_port, naxsi, limit_req)
+    (workdir / "protected_routes.conf").write_text(conf)
+    return len(conf.encode())
+
+
+class Nginx:
+    def __init__(self, binary, workdir, port):
+        self.binary = binary
+        self.workdir = workdir
+        self.port = port
+        self.process = None
+
+    def _cmd(self, *extra):
+        return [self.binary, "-p", str(self.workdir), "-c", str(self.workdir / "nginx.conf"), *extra]
+
+    def test(self):
+        start = time.perf_counter()
+        subprocess.run(self._cmd("-t", "-q"), check=True, capture_output=True, text=True)
+        return time.perf_counter() - start
+
+    def start(self):
+        self.process = subprocess.Popen(self._cmd("-g", "daemon off;"), stderr=subprocess.PIPE)
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("nginx não subiu a tempo")
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+            self.process = None
+
+
+# Geração de carga
+
+
+def ssl_context(client_dir=None):
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    if client_dir:
+        context.load_cert_chain(client_dir / "client.crt", client_dir / "client.key")
+    return context
+
+
+def pick_request(rng, mix, protected):
+    kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+    if kind == "benigno":
+        return kind, rng.choice(BENIGN_PATHS)
+    if kind == "malicioso":
+        return kind, rng.choice(MALICIOUS_PATHS)
+    # mTLS na última rota protegida, o pior caso para a busca por prefixo
+    return kind, (protected[-1] if protected else "/modulo0/recurso") + "?id=1"
+
+
+def load_worker(port, contexts, mix, protected, deadline, seed, samples, lock):
+    rng = random.Random(seed)
+    connections = {}
+    local = []
+
+    while time.time() < deadline:
+        kind, path = pick_request(rng, mix, protected)
+        conn = connections.get(kind)
+        if conn is None:
+            conn = connections[kind] = http.client.HTTPSConnection(
+                "127.0.0.1", port, context=contexts["mtls" if kind == "mtls" else "plain"], timeout=10
+            )
+
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers={"Host": "vidamais.top"})
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            connections.pop(kind, None)
+            status = 0
+        local.append((kind, status, time.perf_counter() - start))
+
+    for conn in connections.values():
+        conn.close()
+    with lock:
+        samples.extend(local)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(samples, duration):
+    def stats(items):
+        latencies = [latency for _, _, latency in items]
+        statuses = Counter(status for _, status, _ in items)
+        blocked = sum(count for status, count in statuses.items() if status in (403, 429, 503) or status == 0)
+        return {
+            "requests": len(items),
+            "rps": round(len(items) / duration, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3) if items else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3) if items else None,
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if items else None,
+            "block_rate": round(blocked / len(items), 4) if items else None,
+            "status": {str(k): v for k, v in sorted(statuses.items())},
+        }
+
+    result = stats(samples)
+    result["por_tipo"] = {kind: stats([s for s in samples if s[0] == kind]) for kind in sorted({s[0] for s in samples})}
+    return result
+
+
+def run_load(port, client_dir, mix, protected, concurrency, duration):
+    contexts = {"plain": ssl_context(), "mtls": ssl_context(client_dir)}
+    samples = []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+    threads = [
+        threading.Thread(target=load_worker, args=(port, contexts, mix, protected, deadline, i, samples, lock))
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(samples, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga ponta a ponta no nginx com WAF, limit_req e rotas mTLS")
+    parser.add_argument("--nginx", default=shutil.which("nginx") or "nginx")
+    parser.add_argument("--naxsi-module", default="/usr/lib/nginx/modules/ngx_http_naxsi_module.so")
+    parser.add_argument("--naxsi-core", default="/etc/nginx/naxsi_core.rules")
+    parser.add_argument("--mime-types", default="/etc/nginx/mime.types")
+    parser.add_argument("--rotas", type=int, nargs="+", default=DEFAULT_ROUTE_COUNTS)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--duracao", type=float, default=10.0, help="segundos de carga por cenário")
+    parser.add_argument("--mix", default=json.dumps(DEFAULT_MIX), help='pesos em JSON, ex.: {"benigno": 1}')
+    parser.add_argument("--modo", choices=sorted(nginx_utils.CONF_GENERATORS), default=nginx_utils.NGINX_CONF_MODE)
+    parser.add_argument("--sem-limit-req", action="store_true", help="remove os limit_req para medir só WAF e rotas")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--manter", action="store_true", help="não apaga o diretório temporário")
+    args = parser.parse_args()
+
+    naxsi_module = args.naxsi_module if Path(args.naxsi_module).exists() else None
+    naxsi_core = args.naxsi_core if Path(args.naxsi_core).exists() else None
+    mime_types = args.mime_types if Path(args.mime_types).exists() else None
+    mix = json.loads(args.mix)
+
+    workdir = Path(tempfile.mkdtemp(prefix="primis-proxy-"))
+    (workdir / "logs").mkdir()
+    stub = start_stub()
+    port = free_port()
+
+    try:
+        _, client_dir = make_pki(workdir)
+        naxsi = write_nginx_conf(
+            workdir, port, stub.server_address[1], naxsi_module, naxsi_core, mime_types, not args.sem_limit_req
+        )
+        nginx = Nginx(args.nginx, workdir, port)
+
+        scenarios = {}
+        for count in args.rotas:
+            conf_bytes = write_routes(workdir, count, stub.server_address[1], naxsi, not args.sem_limit_req, args.modo)
+            parse_s = nginx.test()
+            nginx.start()
+            try:
+                result = run_load(port, client_dir, mix, route_paths(count), args.concorrencia, args.duracao)
+            finally:
+                nginx.stop()
+            result["config_bytes"] = conf_bytes
+            result["nginx_t_s"] = round(parse_s, 4)
+            scenarios[str(count)] = result
+
+        report = {
+            "waf": naxsi,
+            "limit_req": not args.sem_limit_req,
+            "modo": args.modo,
+            "concorrencia": args.concorrencia,
+            "duracao_s": args.duracao,
+            "mix": mix,
+            "rotas": scenarios,
+        }
+    finally:
+        stub.shutdown()
+        if not args.manter:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT / "dashboard"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from gen_logs import access_lines, write_logs  # noqa: E402
+
+
+MODES = ("dev", "gunicorn")
+DEFAULT_LINES = 100000
+DEFAULT_CLIENTS = (1, 4, 16)
+DEFAULT_DURATION = 15
+# Linhas por segundo acrescentadas ao access log durante a carga: sem isso
+# todo pedido sairia do cache
+DEFAULT_WRITE_RATE = 200
+PORT = 5099
+
+# O que um administrador abre no painel
+ENDPOINTS = (
+    "/",
+    "/configurar",
+    "/estatisticas",
+    "/eventos?por_pagina=50",
+    "/naxsi/analise",
+    "/rotas-protegidas/analise",
+    "/certificados/registro",
+)
+
+
+def prepare(directory):
+    # Chamado em cada processo servidor, antes de importar o app
+    from bench_dashboard import fake_supervisorctl, point_to
+
+    directory = Path(directory)
+    fake_supervisorctl(directory)
+    point_to(directory)
+
+    import utils.certs_utils as certs_utils
+    import utils.naxsi_utils as naxsi_utils
+    import utils.reload_utils as reload_utils
+
+    reload_utils.RELOAD_STATE_PATH = directory / "reload"
+    reload_utils.MANAGED_FILES = ()
+    certs_utils.CERT_JOBS_PATH = directory / "cert_jobs"
+    certs_utils.CA_PATH = directory / "ca"
+    certs_utils.key_pool.size = 0
+    naxsi_utils.naxsi_learner.state_path = directory / "naxsi_learning.json"
+    os.environ["DASHBOARD_LEADER_LOCK"] = str(directory / "dashboard.leader")
+
+
+def serve(directory, mode, workers, threads):
+    if mode == "dev":
+        prepare(directory)
+        import app as dashboard_app
+
+        # Mesmo servidor do antigo "python app.py" (Werkzeug com o debugger)
+        dashboard_app.app.run(host="127.0.0.1", port=PORT, debug=True, use_reloader=False, threaded=True)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class DashboardApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"127.0.0.1:{PORT}")
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            # Sem preload: roda em cada worker depois do fork
+            prepare(directory)
+            import app as dashboard_app
+
+            return dashboard_app.app
+
+    DashboardApplication().run()
+
+
+def wait_ready(timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+            conn.request("GET", "/estatisticas")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def writer(directory, rate, stop):
+    path = Path(directory) / "nginx" / "normal_access.log"
+    while not stop.is_set():
+        with open(path, "a") as f:
+            f.writelines(access_lines(max(rate // 10, 1), span=1, seed=time.time_ns()))
+        stop.wait(0.1)
+
+
+def client(index, deadline, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=60)
+    i = index
+    while time.monotonic() < deadline:
+        path = ENDPOINTS[i % len(ENDPOINTS)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(f"{path}: {response.status}")
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(f"{path}: {e}")
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run_load(directory, clients, duration, rate):
+    latencies, errors = [], []
+    stop = threading.Event()
+    background = threading.Thread(target=writer, args=(directory, rate, stop), daemon=True)
+    background.start()
+
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client, args=(i, deadline, latencies, errors)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    background.join()
+
+    if not latencies:
+        return {"erros": len(errors), "exemplo_erro": errors[:1]}
+    return {
+        "pedidos": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "erros": len(errors),
+    }
+
+
+def run_mode(directory, mode, args):
+    # O Werkzeug registra cada pedido no stderr; um PIPE não lido travaria o servidor
+    log_path = Path(directory) / "servidor.log"
+    server_log = open(log_path, "w")
+    server = subprocess.Popen(
+        [
+            sys.executable, __file__, "--servir", str(directory), "--modo-servidor", mode,
+            "--workers", str(args.workers), "--threads", str(args.threads),
+        ],
+        stdout=server_log,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    try:
+        if not wait_ready():
+            server.kill()
+            return {"error": log_path.read_text(errors="replace").strip().splitlines()[-3:]}
+        # Primeira passada fora da medição: aquece os caches de todos os workers
+        run_load(directory, args.workers, 2, 0)
+        return {str(clients): run_load(directory, clients, args.duracao, args.escrita) for clients in args.clientes}
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+        server_log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão e latência do painel com vários administradores ao mesmo tempo")
+    parser.add_argument("--modos", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--linhas", type=int, default=DEFAULT_LINES, help="linhas do normal_access.log")
+    parser.add_argument("--clientes", type=int, nargs="+", default=DEFAULT_CLIENTS, help="clientes simultâneos")
+    parser.add_argument("--duracao", type=float, default=DEFAULT_DURATION, help="segundos de carga por rodada")
+    parser.add_argument("--escrita", type=int, default=DEFAULT_WRITE_RATE, help="linhas/s acrescentadas ao log")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--manter", action="store_true", help="não apaga os logs gerados")
+    parser.add_argument("--servir", help=argparse.SUPPRESS)
+    parser.add_argument("--modo-servidor", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servir:
+        serve(args.servir, args.modo_servidor, args.workers, args.threads)
+        return
+
+    results = {}
+    for mode in args.modos:
+        # Diretório novo por modo: o banco de eventos e os caches começam vazios
+        directory = Path(tempfile.mkdtemp(prefix=f"primis-serving-{mode}-"))
+        try:
+            write_logs(directory, args.linhas)
+            results[mode] = run_mode(directory, mode, args)
+        finally:
+            if not args.manter:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "linhas": args.linhas,
+        "duracao_s": args.duracao,
+        "escrita_linhas_s": args.escrita,
+        "workers": args.workers,
+        "threads": args.threads,
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
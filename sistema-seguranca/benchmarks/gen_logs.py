@@ -0,0 +1,141 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+
+TZ = timezone(timedelta(hours=-3))
+CHUNK = 10000
+
+METHODS = ("GET", "GET", "GET", "POST", "HEAD")
+STATUSES = (200, 200, 200, 200, 302, 304, 403, 404, 404, 500)
+URLS = (
+    "/",
+    "/interface/login/login.php",
+    "/interface/main/tabs/main.php",
+    "/interface/patient_file/summary/demographics.php",
+    "/portal/index.php",
+    "/library/ajax/execute_background_services.php",
+    "/wp-login.php",
+    "/.env",
+    "/phpmyadmin/index.php",
+)
+AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "curl/8.5.0",
+    "python-requests/2.31.0",
+    "Nmap Scripting Engine",
+)
+NAXSI_RULES = (
+    ("$SQL", "ARGS", 1000, "id"),
+    ("$SQL", "ARGS", 1009, "q"),
+    ("$XSS", "ARGS", 1302, "search"),
+    ("$TRAVERSAL", "URL", 1205, ""),
+    ("$XSS", "BODY", 1315, "comment"),
+    ("$EVADE", "HEADERS", 1402, "cookie"),
+)
+
+
+def random_ip(rng):
+    # Poucos IPs muito ativos e uma cauda longa, como em um scan real
+    if rng.random() < 0.6:
+        return f"10.0.{rng.randint(0, 3)}.{rng.randint(1, 20)}"
+    return f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+
+def _timestamps(count, span):
+    end = datetime.now(tz=TZ)
+    start = end - timedelta(seconds=span)
+    step = span / max(count, 1)
+    for i in range(count):
+        yield start + timedelta(seconds=i * step)
+
+
+def access_lines(count, span=7 * 86400, seed=1):
+    rng = random.Random(seed)
+    for date in _timestamps(count, span):
+        yield (
+            f'{random_ip(rng)} - - [{date.strftime("%d/%b/%Y:%H:%M:%S %z")}] '
+            f'"{rng.choice(METHODS)} {rng.choice(URLS)}?id={rng.randint(1, 9999)} HTTP/1.1" '
+            f'{rng.choice(STATUSES)} {rng.randint(100, 90000)} "-" "{rng.choice(AGENTS)}"\n'
+        )
+
+
+def naxsi_fmt(rng, ip, url, learning=0):
+    parts = [f"ip={ip}", "server=vidamais.top", f"uri={url}", f"learning={learning}", "vers=1.3"]
+    parts += ["total_processed=%d" % rng.randint(1, 10 ** 6), "total_blocked=%d" % rng.randint(1, 10 ** 4), "block=1"]
+    for i in range(rng.randint(1, 2)):
+        cscore, zone, rule_id, var_name = rng.choice(NAXSI_RULES)
+        parts += [f"cscore{i}={cscore}", f"score{i}=8", f"zone{i}={zone}", f"id{i}={rule_id}", f"var_name{i}={var_name}"]
+    return "NAXSI_FMT: " + "&".join(parts)
+
+
+def error_lines(count, span=7 * 86400, seed=2, naxsi_ratio=0.7):
+    rng = random.Random(seed)
+    for n, date in enumerate(_timestamps(count, span)):
+        ip = random_ip(rng)
+        url = rng.choice(URLS)
+        prefix = f"{date.strftime('%Y/%m/%d %H:%M:%S')} [error] {rng.randint(10, 99)}#0: *{n + 1} "
+        suffix = f', client: {ip}, server: vidamais.top, request: "GET {url} HTTP/1.1", host: "vidamais.top"\n'
+        if rng.random() < naxsi_ratio:
+            yield prefix + naxsi_fmt(rng, ip, url) + suffix
+        else:
+            yield prefix + "upstream timed out (110: Connection timed out) while reading response header from upstream" + suffix
+
+
+def fail2ban_lines(count, span=7 * 86400, seed=3):
+    rng = random.Random(seed)
+    for date in _timestamps(count, span):
+        yield f"{int(date.timestamp())} - {rng.randint(10, 40)} - {random_ip(rng)} - nginx-4xx - Muitos acessos com erro 4xx\n"
+
+
+def certs_lines(count, span=30 * 86400, seed=4):
+    rng = random.Random(seed)
+    for date in _timestamps(count, span):
+        name = f"cliente{rng.randint(1, 500)}"
+        action = rng.choice(("Chave privada gerada para", "Certificado assinado para", "Cliente adicionado:", "Certificado revogado:"))
+        yield f"{date.strftime('%d/%m/%Y %H:%M:%S')} {action} {name}\n"
+
+
+def write_lines(path, lines):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= CHUNK:
+                f.writelines(chunk)
+                chunk = []
+        f.writelines(chunk)
+
+
+def write_logs(directory, count):
+    # Mesma estrutura de /var/log dentro do container
+    directory = Path(directory)
+    nginx = directory / "nginx"
+    small = max(count // 100, 10)
+
+    write_lines(nginx / "normal_access.log", access_lines(count))
+    write_lines(nginx / "protected_access.log", access_lines(count // 10, seed=11))
+    write_lines(nginx / "normal_error.log", error_lines(count // 10))
+    write_lines(nginx / "protected_error.log", error_lines(count // 100, seed=12))
+    write_lines(nginx / "error.log", error_lines(small, seed=13, naxsi_ratio=0))
+    write_lines(directory / "fail2ban-actions.log", fail2ban_lines(small))
+    write_lines(directory / "certs.log", certs_lines(small))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera logs sintéticos de nginx, NAXSI, fail2ban e certificados")
+    parser.add_argument("destino")
+    parser.add_argument("--linhas", type=int, default=10000, help="linhas do normal_access.log; os outros são proporcionais")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_logs(args.destino, args.linhas)
+    print(f"Logs gerados em {args.destino} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
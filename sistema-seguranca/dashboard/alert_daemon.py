@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import socket
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from utils.alert_utils import AlertDispatcher
+
+
+# As ações do fail2ban mandam um datagrama JSON por banimento para este socket
+ALERT_SOCKET_PATH = os.environ.get("ALERT_SOCKET_PATH", "/run/primislayer/alerts.sock")
+
+DIGEST_INTERVAL = 60
+# O mesmo IP na mesma jail só volta a aparecer num resumo depois desse tempo
+DEDUP_TTL = 600
+# Limite do Telegram para grupos: ~20 mensagens por minuto
+RATE_LIMIT_PER_MINUTE = 20
+DIGEST_TOP = 5
+CRITICAL_LEVELS = ("Crítica",)
+
+logger = logging.getLogger("alert_daemon")
+
+
+class RateLimiter:
+    # Balde de fichas por canal
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def format_digest(jail, pending, now):
+    top = ", ".join(f"`{ip}` ({count})" for ip, count in pending["ips"].most_common(DIGEST_TOP))
+    text = f"""
+**RESUMO DE BANIMENTOS**
+• *Jail*: `{jail}`
+• *IPs banidos*: {len(pending["ips"])} nos últimos {int(now - pending["first"])}s
+• *Top {DIGEST_TOP}*: {top}
+"""
+    if pending["repeated"]:
+        text += f"• *Reincidências já alertadas*: {pending['repeated']}\n"
+    text += f"• *Data*: {datetime.fromtimestamp(now).strftime('%d/%m/%Y %H:%M:%S')}\n"
+    return text
+
+
+class AlertCoalescer:
+    def __init__(self, dispatcher, interval=DIGEST_INTERVAL, dedup_ttl=DEDUP_TTL, limiter=None):
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self.dedup_ttl = dedup_ttl
+        self.limiter = limiter or RateLimiter()
+        self.pending = {}
+        self.last_seen = {}
+        self.stats = Counter()
+        self.last_flush = time.time()
+
+    def handle(self, alert, now=None):
+        now = time.time() if now is None else now
+        ip = alert.get("ip", "")
+        jail = alert.get("jail") or "painel"
+        level = alert.get("level") or "Média"
+        self.stats["recebidos"] += 1
+
+        if level in CRITICAL_LEVELS:
+            # Crítico não espera o resumo; consome uma ficha se houver, mas não é segurado
+            self.limiter.take()
+            self.dispatcher.send(ip, alert.get("action", ""), level, alert.get("msg", ""))
+            self.stats["imediatos"] += 1
+            return
+
+        pending = self.pending.get(jail)
+        if pending is None:
+            pending = self.pending[jail] = {"ips": Counter(), "repeated": 0, "first": now, "alert": None}
+
+        key = (ip, jail)
+        if now - self.last_seen.get(key, 0) < self.dedup_ttl and ip not in pending["ips"]:
+            pending["repeated"] += 1
+            self.stats["duplicados"] += 1
+            return
+
+        self.last_seen[key] = now
+        pending["ips"][ip] += 1
+        pending["alert"] = alert
+
+    def flush(self, now=None):
+        now = time.time() if now is None else now
+        self.last_flush = now
+
+        for jail, pending in list(self.pending.items()):
+            if not pending["ips"]:
+                # Só reincidências: nada novo para contar
+                del self.pending[jail]
+                continue
+            if not self.limiter.take():
+                # Sem ficha: continua acumulando para o próximo resumo
+                self.stats["adiados"] += 1
+                continue
+
+            del self.pending[jail]
+            if len(pending["ips"]) == 1 and sum(pending["ips"].values()) == 1:
+                alert = pending["alert"]
+                self.dispatcher.send(alert.get("ip", ""), alert.get("action", ""), alert.get("level") or "Média", alert.get("msg", ""))
+                self.stats["individuais"] += 1
+            else:
+                self.dispatcher.send_text(format_digest(jail, pending, now))
+                self.stats["resumos"] += 1
+
+        limit = now - self.dedup_ttl
+        for key in [key for key, seen in self.last_seen.items() if seen < limit]:
+            del self.last_seen[key]
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return now - self.last_flush >= self.interval
+
+
+def open_socket(path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    os.chmod(path, 0o660)
+    sock.settimeout(1.0)
+    return sock
+
+
+def serve(path=ALERT_SOCKET_PATH):
+    dispatcher = AlertDispatcher()
+    dispatcher.start()
+    coalescer = AlertCoalescer(dispatcher)
+    sock = open_socket(path)
+    logger.info("Aguardando alertas em %s", path)
+    logged = Counter()
+
+    while True:
+        try:
+            data = sock.recv(65536)
+        except socket.timeout:
+            data = None
+
+        if data:
+            try:
+                alert = json.loads(data.decode("utf-8", errors="replace"))
+                if not isinstance(alert, dict):
+                    raise ValueError
+            except ValueError:
+                coalescer.stats["invalidos"] += 1
+            else:
+                coalescer.handle(alert)
+
+        if coalescer.due():
+            coalescer.flush()
+            if coalescer.stats != logged:
+                logged = coalescer.stats.copy()
+                logger.info("Alertas: %s | envio: %s", dict(logged), dispatcher.snapshot())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    serve()
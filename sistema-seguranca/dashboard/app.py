@@ -1,43 +1,222 @@
-from flask import Flask, render_template, jsonify, request, abort, send_file
-from utils.fail2ban_utils import get_fail2ban_logs
-from utils.nginx_utils import delete_location, add_location, list_locations, get_dict_logs, nginx_alive, get_insights
+from flask import Flask, render_template, jsonify, request, abort, send_file, Response, stream_with_context, g
+from utils.fail2ban_utils import get_fail2ban_logs, list_active_bans, ban_ips, unban_ips, export_bans, import_bans, FAIL2BAN_JAIL
+from utils.fail2ban_utils import offense_history, repeat_offenders, OFFENSE_DEFAULT_DAYS, OFFENSE_RETENTION_DAYS
+from utils.nginx_utils import delete_location, add_location, list_locations, get_dict_logs, nginx_alive, get_insights, apply_location_changes, analyze_locations, get_naxsi_insights
 from utils.certs_utils import (
     delete_client_cert,
-    add_client_cert,
+    revoke_client_certs,
+    submit_client_cert,
+    submit_client_certs,
+    get_cert_job,
+    list_cert_jobs,
     get_client_p12_path,
     list_client_certs,
-    get_certs_logs
+    get_certs_logs,
+    start_key_pool,
+    start_expiry_alerts,
+    client_registry,
+    expiring_client_certs,
+    CERT_EXPIRY_WARN_DAYS,
+    key_pool_stats,
+    CERT_KEY_TYPE,
 )
 from utils.naxsi_utils import get_naxsi_whitelist, get_optimized_rules, save_optimized_rules, activate_learning_mode, deactivate_learning_mode, learning_mode_active
+from utils.log_utils import start_ingestion
+from utils.insights_utils import WINDOWS, DEFAULT_WINDOW
+from utils.events_utils import start_event_store, search_events, EVENT_SOURCES
+from utils.stream_utils import STREAM_TABLES, STREAM_MAX_CLIENTS, start_streaming, subscribe, unsubscribe, sse_events, client_count
+from utils.cache_utils import cache_stats
+from utils.reload_utils import snapshot_config, reload_history
+from utils.alert_utils import start_alerts, send_alert, alert_stats
+from utils.fs_utils import elect_leader
+from utils.metrics_utils import start_metrics, observe, render, run
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
 import subprocess
+import time
+
+# Com vários workers (gunicorn), só o que segura este lock grava eventos,
+# completa o pool de chaves e verifica vencimentos
+LEADER_LOCK_PATH = os.environ.get("DASHBOARD_LEADER_LOCK", "/run/primislayer/dashboard.leader")
+
+
+def start_leader_tasks():
+    snapshot_config()
+    start_event_store()
+    start_key_pool()
+    start_expiry_alerts()
+
 
 app = Flask(__name__)
+collector_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="collector")
+leader = elect_leader(LEADER_LOCK_PATH, start_leader_tasks)
+start_streaming()
+start_ingestion()
+start_alerts()
+start_metrics()
+
+
+@app.template_filter("datetime")
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts).strftime("%d/%m/%Y")
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # Nas rotas de streaming mede só até o início da resposta
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "desconhecida"
+        observe(
+            "primis_http_request_seconds", time.perf_counter() - start,
+            route=route, method=request.method, status=response.status_code,
+        )
+    return response
+
+
+def reload_failed(reload):
+    return reload is not None and reload.get("status") == "erro"
+
 
 def telegram_alert(ip, action, level, msg=""):
-    subprocess.run(["python", "/etc/scripts/telegram_alert.py", str(ip), str(action), str(level), str(msg)], check=True)
-    
+    send_alert(ip, action, level, msg)
+
 
 # Rotas principais
 
 
 @app.route("/")
 def dashboard():
-    fail2ban_logs = get_fail2ban_logs()
-    nginx_logs = get_dict_logs()
-    certs_logs = get_certs_logs()
-    insights = get_insights()
+    window = request.args.get("janela", DEFAULT_WINDOW)
+    if window not in WINDOWS:
+        window = DEFAULT_WINDOW
 
-    return render_template("dashboard.html", fail2ban_logs=fail2ban_logs, **nginx_logs, certs_logs=certs_logs, insights=insights)
+    fail2ban_logs = collector_pool.submit(get_fail2ban_logs)
+    nginx_logs = collector_pool.submit(get_dict_logs)
+    certs_logs = collector_pool.submit(get_certs_logs)
+    insights = collector_pool.submit(get_insights, window)
+    naxsi = collector_pool.submit(get_naxsi_insights, window)
+
+    fail2ban_logs, nginx_logs, certs_logs, insights, naxsi = (
+        fail2ban_logs.result(), nginx_logs.result(), certs_logs.result(), insights.result(), naxsi.result()
+    )
+
+    return render_template(
+        "dashboard.html", fail2ban_logs=fail2ban_logs, **nginx_logs, certs_logs=certs_logs,
+        insights=insights, naxsi=naxsi, window=window, windows=list(WINDOWS)
+    )
 
 
 @app.route("/configurar", methods=["GET", "POST"])
 def manage_config():
-    routes = list_locations()
-    certs = list_client_certs()
-    nginx_active = nginx_alive()
-    learning_mode = learning_mode_active()
+    routes = collector_pool.submit(list_locations)
+    certs = collector_pool.submit(list_client_certs)
+    registry = collector_pool.submit(client_registry)
+    nginx_active = collector_pool.submit(nginx_alive)
+    learning_mode = collector_pool.submit(learning_mode_active)
+
+    routes, certs, registry, nginx_active, learning_mode = (
+        routes.result(), certs.result(), registry.result(), nginx_active.result(), learning_mode.result()
+    )
+
+    return render_template(
+        "config.html", routes=routes, certs=certs, registry=registry, nginx_active=nginx_active,
+        learning_mode=learning_mode, now=int(time.time()), warn_days=CERT_EXPIRY_WARN_DAYS
+    )
+
+
+@app.route("/estatisticas")
+def stats():
+    return jsonify({
+        "cache": cache_stats(), "reloads": reload_history(), "alertas": alert_stats(), "pool_chaves": key_pool_stats(),
+        "worker": {"pid": os.getpid(), "lider": leader.is_set()},
+        "streams": {"conectados": client_count(), "limite": STREAM_MAX_CLIENTS},
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+def parse_time_arg(value):
+    if value is None or value == "":
+        return None
+    if value.isdigit():
+        return int(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def int_arg(name, default=None):
+    # request.args.get(type=int) transformaria um valor inválido em None e o
+    # filtro sumiria da consulta em silêncio
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' deve ser um número inteiro")
+
 
-    return render_template("config.html", routes=routes, certs=certs, nginx_active=nginx_active, learning_mode=learning_mode)
+@app.route("/eventos")
+def search_events_route():
+    args = request.args
+    try:
+        since = parse_time_arg(args.get("desde"))
+        until = parse_time_arg(args.get("ate"))
+        if args.get("horas"):
+            since = time.time() - float(args["horas"]) * 3600
+        if args.get("fonte") and args["fonte"] not in EVENT_SOURCES:
+            raise ValueError(f"'fonte' deve ser uma de: {', '.join(EVENT_SOURCES)}")
+
+        result = search_events(
+            ip=args.get("ip"),
+            status=int_arg("status"),
+            path=args.get("path"),
+            source=args.get("fonte"),
+            since=since,
+            until=until,
+            page=int_arg("pagina", 1),
+            per_page=int_arg("por_pagina", 100),
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Parâmetro inválido: {str(e)}"}), 400
+
+    return jsonify(result)
+
+
+@app.route("/stream")
+def stream_logs():
+    tables = request.args.get("tabelas")
+    tables = [t for t in tables.split(",") if t in STREAM_TABLES] if tables else STREAM_TABLES
+    if not tables:
+        return jsonify({"error": "Nenhuma tabela válida"}), 400
+
+    client = subscribe(tables, ip=request.args.get("ip") or None)
+    if client is None:
+        return jsonify({"error": "Limite de conexões de streaming atingido"}), 503, {"Retry-After": "30"}
+
+    response = Response(
+        stream_with_context(sse_events(client)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Libera a vaga mesmo se o gerador nunca chegar a rodar
+    response.call_on_close(lambda: unsubscribe(client))
+    return response
+
+
+@app.route("/stream/recentes")
+def recent_stream_records():
+    # Alternativa por consulta periódica quando o /stream está no limite
+    return jsonify({**get_dict_logs(), "fail2ban": get_fail2ban_logs(), "certs": get_certs_logs()})
 
 
 # Rotas para gerenciar as rotas protegidas
@@ -48,6 +227,11 @@ def get_locations():
     return jsonify(list_locations())
 
 
+@app.route("/rotas-protegidas/analise", methods=["GET"])
+def analyze_routes():
+    return jsonify(analyze_locations(list_locations()))
+
+
 @app.route("/rotas-protegidas", methods=["POST"])
 def add_route():
     data = request.get_json()
@@ -55,10 +239,17 @@ def add_route():
     if not path or not path.startswith("/"):
         return jsonify({"error": "Path inválido"}), 400
 
-    add_location(path)
+    result = add_location(path)
+    reload = result["reload"]
+    if result["status"] == "inválido":
+        return jsonify({"error": "Path inválido"}), 400
+    if result["status"] == "existente":
+        return jsonify({"error": f"Path {path} já está protegido"}), 409
+    if reload_failed(reload):
+        return jsonify({"error": "Configuração inválida, alteração desfeita", "reload": reload}), 500
     telegram_alert(request.remote_addr, "Nova rota protegida adicionada", "Baixa")
 
-    return jsonify({"message": f"Path {path} adicionado"}), 201
+    return jsonify({"message": f"Path {path} adicionado", "reload": reload}), 201
 
 
 @app.route("/rotas-protegidas", methods=["DELETE"])
@@ -68,10 +259,34 @@ def delete_route():
     if not path or not path.startswith("/"):
         return jsonify({"error": "Path inválido"}), 400
 
-    delete_location(path)
+    result = delete_location(path)
+    reload = result["reload"]
+    if result["status"] == "inexistente":
+        return jsonify({"error": f"Path {path} não está protegido"}), 404
+    if reload_failed(reload):
+        return jsonify({"error": "Configuração inválida, alteração desfeita", "reload": reload}), 500
     telegram_alert(request.remote_addr, "Rota protegida excluída", "Alta")
 
-    return jsonify({"message": f"Path {path} removido"}), 200
+    return jsonify({"message": f"Path {path} removido", "reload": reload}), 200
+
+
+@app.route("/rotas-protegidas/lote", methods=["POST"])
+def bulk_routes():
+    data = request.get_json(silent=True) or {}
+    add = data.get("adicionar", [])
+    remove = data.get("remover", [])
+    if not isinstance(add, list) or not isinstance(remove, list) or not (add or remove):
+        return jsonify({"error": "Informe as listas 'adicionar' e/ou 'remover'"}), 400
+
+    result = apply_location_changes(add=add, remove=remove)
+    if reload_failed(result["reload"]):
+        return jsonify({"error": "Configuração inválida, alterações desfeitas", **result}), 500
+
+    if result["reload"] is not None:
+        changed = sum(1 for r in result["results"] if r["status"] in ("adicionado", "removido"))
+        telegram_alert(request.remote_addr, f"Rotas protegidas alteradas em lote ({changed})", "Alta")
+
+    return jsonify(result), 200
 
 
 # Rotas para gerenciar os certificados
@@ -84,11 +299,68 @@ def revoke_cert(name):
     return str(r), 200
 
 
-@app.route("/certificados/adicionar/<string:name>")
+@app.route("/certificados/adicionar/<string:name>", methods=["GET", "POST"])
 def add_cert(name):
-    r = add_client_cert(name)
+    # A emissão roda em segundo plano; o andamento fica em /certificados/jobs/<id>
+    data = request.get_json(silent=True) or {}
+    try:
+        job = submit_client_cert(name, data.get("senha"), data.get("chave") or CERT_KEY_TYPE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     telegram_alert(request.remote_addr, "Criação de novo certificado", "Média")
-    return str(r), 200
+    return jsonify(job), 202
+
+
+@app.route("/certificados/lote", methods=["POST"])
+def bulk_certs():
+    # Revogações na hora (um CRL e um reload); emissões num job em segundo plano
+    data = request.get_json(silent=True) or {}
+    add = data.get("adicionar", [])
+    remove = data.get("remover", [])
+    if not isinstance(add, list) or not isinstance(remove, list) or not (add or remove):
+        return jsonify({"error": "Informe as listas 'adicionar' e/ou 'remover'"}), 400
+
+    try:
+        job = submit_client_certs(add) if add else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if job is not None:
+        telegram_alert(request.remote_addr, f"Criação de certificados em lote ({len(add)})", "Média")
+
+    revoked = revoke_client_certs([str(name) for name in remove]) if remove else None
+    count = sum(1 for r in revoked["results"] if r["status"] == "revogado") if revoked is not None else 0
+    if count:
+        telegram_alert(request.remote_addr, f"Revogação de certificados em lote ({count})", "Alta")
+
+    return jsonify({"remover": revoked, "adicionar": job}), 202 if job is not None else 200
+
+
+@app.route("/certificados/registro")
+def cert_registry():
+    return jsonify(client_registry())
+
+
+@app.route("/certificados/vencendo")
+def expiring_certs():
+    try:
+        days = int(request.args.get("dias", CERT_EXPIRY_WARN_DAYS))
+    except ValueError:
+        return jsonify({"error": "Parâmetro 'dias' inválido"}), 400
+    return jsonify({"dias": days, "certificados": expiring_client_certs(days)})
+
+
+@app.route("/certificados/jobs")
+def cert_jobs():
+    return jsonify(list_cert_jobs())
+
+
+@app.route("/certificados/jobs/<string:job_id>")
+def cert_job(job_id):
+    job = get_cert_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    return jsonify(job)
 
 
 @app.route("/certificados/download/<string:name>")
@@ -120,13 +392,23 @@ def optimized_naxsi_rules():
 @app.post("/naxsi/save-rules")
 def save_naxsi_whitelist():
     try:
-        save_optimized_rules()
+        reload = save_optimized_rules()
+        if reload_failed(reload):
+            return jsonify({"error": "Whitelist inválida, alteração desfeita", "reload": reload}), 500
         telegram_alert(request.remote_addr, "Novas regras NAXSI foram geradas e aplicadas", "Alta")
-        return "", 200
+        return jsonify({"reload": reload}), 200
     except Exception as e:
         abort(500, description=f"Erro interno: {str(e)}")
 
 
+@app.route("/naxsi/analise")
+def naxsi_analytics():
+    window = request.args.get("janela", DEFAULT_WINDOW)
+    if window not in WINDOWS:
+        return jsonify({"error": f"Janela inválida, use uma de {list(WINDOWS)}"}), 400
+    return jsonify(get_naxsi_insights(window))
+
+
 @app.route("/naxsi/current-rules")
 def current_naxsi_whitelist():
     rules = get_naxsi_whitelist()
@@ -139,7 +421,8 @@ def current_naxsi_whitelist():
 @app.route('/config/desligar-nginx', methods=['POST'])
 def shutdown_nginx():
     try:
-        result = subprocess.run(['supervisorctl', 'stop', 'nginx'], check=True, capture_output=True, text=True)
+        result = run(['supervisorctl', 'stop', 'nginx'], check=True, capture_output=True, text=True)
+        nginx_alive.cache_clear()
         telegram_alert(request.remote_addr, "O servidor foi desligado por painel", "Média")
         return "", 200
     except subprocess.CalledProcessError as e:
@@ -149,7 +432,8 @@ def shutdown_nginx():
 @app.route('/config/ligar-nginx', methods=['POST'])
 def turn_on_nginx():
     try:
-        result = subprocess.run(['supervisorctl', 'start', 'nginx'], check=True, capture_output=True, text=True)
+        result = run(['supervisorctl', 'start', 'nginx'], check=True, capture_output=True, text=True)
+        nginx_alive.cache_clear()
         telegram_alert(request.remote_addr, "O servidor foi ativado por painel", "Média")
         return "", 200
     except subprocess.CalledProcessError as e:
@@ -159,9 +443,11 @@ def turn_on_nginx():
 @app.route('/config/ativar-aprendizado', methods=["POST"])
 def naxsi_activate_learning_mode():
     try:
-        activate_learning_mode()
+        reload = activate_learning_mode()
+        if reload_failed(reload):
+            return jsonify({"error": reload["error"], "reload": reload}), 500
         telegram_alert(request.remote_addr, "Modo aprendizado NAXSI ativado", "Crítica")
-        return "", 200
+        return jsonify({"reload": reload}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -169,12 +455,92 @@ def naxsi_activate_learning_mode():
 @app.route('/config/desativar-aprendizado', methods=["POST"])
 def naxsi_deactivate_learning_mode():
     try:
-        deactivate_learning_mode()
+        reload = deactivate_learning_mode()
+        if reload_failed(reload):
+            return jsonify({"error": reload["error"], "reload": reload}), 500
         telegram_alert(request.remote_addr, "Modo aprendizado NAXSI ativado", "Média")
-        return "", 200
+        return jsonify({"reload": reload}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Rotas para os banimentos
+
+
+@app.route("/banimentos", methods=["GET"])
+def active_bans():
+    bans = list_active_bans()
+    return jsonify({"total": len(bans), "bans": bans})
+
+
+def ban_request_ips():
+    data = request.get_json(silent=True) or {}
+    ips = data.get("ips")
+    if not isinstance(ips, list) or not ips:
+        return None, data
+    return ips, data
+
+
+@app.route("/banimentos", methods=["POST"])
+def ban():
+    ips, data = ban_request_ips()
+    if ips is None:
+        return jsonify({"error": "Informe a lista 'ips'"}), 400
+
+    result = ban_ips(ips, data.get("jail") or FAIL2BAN_JAIL)
+    if result["banidos"]:
+        telegram_alert(request.remote_addr, f"{result['banidos']} IPs banidos pelo painel", "Alta")
+    return jsonify(result), 500 if result["erros"] else 200
+
+
+@app.route("/banimentos", methods=["DELETE"])
+def unban():
+    ips, data = ban_request_ips()
+    if ips is None:
+        return jsonify({"error": "Informe a lista 'ips'"}), 400
+
+    result = unban_ips(ips, data.get("jail") or FAIL2BAN_JAIL)
+    if result["desbanidos"]:
+        telegram_alert(request.remote_addr, f"{result['desbanidos']} IPs desbanidos pelo painel", "Alta")
+    return jsonify(result), 500 if result["erros"] else 200
+
+
+@app.route("/banimentos/historico")
+def ban_history():
+    try:
+        days = int(request.args.get("dias", OFFENSE_DEFAULT_DAYS))
+    except ValueError:
+        return jsonify({"error": "Parâmetro 'dias' inválido"}), 400
+    if not 1 <= days <= OFFENSE_RETENTION_DAYS:
+        return jsonify({"error": f"'dias' deve estar entre 1 e {OFFENSE_RETENTION_DAYS}"}), 400
+
+    ip = request.args.get("ip")
+    if ip:
+        return jsonify(offense_history(ip, days))
+    return jsonify(repeat_offenders(days))
+
+
+@app.route("/banimentos/exportar")
+def export_ban_list():
+    ips = export_bans()
+    return Response("".join(f"{ip}\n" for ip in ips), mimetype="text/plain",
+                    headers={"Content-Disposition": "attachment; filename=banimentos.txt"})
+
+
+@app.route("/banimentos/importar", methods=["POST"])
+def import_ban_list():
+    # Aceita o arquivo de /banimentos/exportar como upload ou no corpo da requisição
+    upload = request.files.get("arquivo")
+    text = upload.read().decode("utf-8", errors="replace") if upload else request.get_data(as_text=True)
+    if not text.strip():
+        return jsonify({"error": "Lista de IPs vazia"}), 400
+
+    result = import_bans(text, request.args.get("jail") or FAIL2BAN_JAIL)
+    if result["banidos"]:
+        telegram_alert(request.remote_addr, f"{result['banidos']} IPs importados para a lista de banidos", "Alta")
+    return jsonify(result), 500 if result["erros"] else 200
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Só para desenvolvimento; no container o painel roda no gunicorn (gunicorn.conf.py)
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get("DASHBOARD_DEBUG") == "1", threaded=True)
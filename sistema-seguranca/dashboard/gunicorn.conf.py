@@ -0,0 +1,18 @@
+import os
+
+# Painel em produção: gthread atende vários pedidos por worker e os workers
+# dividem o trabalho de CPU (renderização, insights, emissão de certificados).
+# Sem preload: cada worker importa o app.py e faz a própria eleição de líder
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = "app:app"
+bind = os.environ.get("DASHBOARD_BIND", "0.0.0.0:5000")
+worker_class = "gthread"
+# Com um único núcleo, mais de um worker só repete o trabalho dos caches
+workers = int(os.environ.get("DASHBOARD_WORKERS", min(os.cpu_count() or 1, 4)))
+# Cada cliente do /stream (SSE) ocupa uma thread enquanto estiver conectado;
+# no máximo DASHBOARD_STREAMS por worker (padrão: metade das threads)
+threads = int(os.environ.get("DASHBOARD_THREADS", "8"))
+timeout = int(os.environ.get("DASHBOARD_TIMEOUT", "120"))
+graceful_timeout = 10
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,146 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from utils.metrics_utils import record_external
+
+
+# Mesmo .env usado pelo scripts/telegram_alert.py do fail2ban
+TELEGRAM_ENV_PATH = "/etc/scripts/.env"
+load_dotenv(TELEGRAM_ENV_PATH)
+
+# Pode apontar para um servidor local nos testes
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+ALERT_QUEUE_SIZE = 1000
+ALERT_RETRIES = 3
+ALERT_BACKOFF = 1.0
+ALERT_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+
+
+def format_alert(ip, action, level, msg=""):
+    text = f"""
+**ALERTA DE SEGURANÇA**
+• *IP*: `{ip}`
+• *Ação*: `{action}`
+• *Nível de Segurança*: `{level}`
+• *Data*: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
+"""
+    if msg:
+        text += f"""• *Mensagem*: `{msg}`"""
+    return text
+
+
+class AlertDispatcher:
+    # Fila limitada consumida por uma thread com uma sessão HTTP reaproveitada:
+    # a rota do painel só enfileira e nunca espera o Telegram
+    def __init__(self, maxsize=ALERT_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stats = Counter()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+                self._thread.start()
+
+    def send(self, ip, action, level, msg=""):
+        return self.send_text(format_alert(ip, action, level, msg))
+
+    def send_text(self, text):
+        try:
+            self.queue.put_nowait(text)
+            self.stats["enfileirados"] += 1
+            return True
+        except queue.Full:
+            # Telegram fora do ar por muito tempo: descarta em vez de acumular
+            self.stats["descartados"] += 1
+            return False
+
+    def _run(self):
+        while True:
+            text = self.queue.get()
+            try:
+                self._deliver(text)
+            except Exception:
+                self.stats["falhas"] += 1
+                logger.exception("Erro ao enviar alerta")
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, text):
+        token = os.environ.get("TOKEN")
+        chat_id = os.environ.get("CHAT_ID")
+        if not token or not chat_id:
+            self.stats["sem_configuracao"] += 1
+            return
+
+        url = f"{TELEGRAM_API_URL}/bot{token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
+
+        delay = ALERT_BACKOFF
+        for attempt in range(ALERT_RETRIES + 1):
+            if attempt:
+                self.stats["novas_tentativas"] += 1
+                time.sleep(delay)
+                delay *= 2
+
+            start = time.perf_counter()
+            try:
+                response = self.session.post(url, json=payload, timeout=ALERT_TIMEOUT)
+            except requests.RequestException as e:
+                record_external("telegram", "erro", time.perf_counter() - start)
+                logger.warning("Falha ao enviar alerta: %s", e)
+                continue
+            record_external("telegram", response.status_code, time.perf_counter() - start)
+
+            if response.ok:
+                self.stats["enviados"] += 1
+                return
+            if response.status_code == 429:
+                # O Telegram informa quanto tempo esperar
+                try:
+                    delay = max(delay, float(response.json()["parameters"]["retry_after"]))
+                except (ValueError, KeyError, TypeError):
+                    pass
+                continue
+            if response.status_code < 500:
+                # Erro do pedido (token, chat_id, markdown): repetir não resolve
+                logger.warning("Alerta recusado: %s %s", response.status_code, response.text)
+                break
+
+        self.stats["falhas"] += 1
+
+    def snapshot(self):
+        return {**self.stats, "na_fila": self.queue.qsize()}
+
+
+dispatcher = AlertDispatcher()
+
+
+def start_alerts():
+    dispatcher.start()
+
+
+def send_alert(ip, action, level, msg=""):
+    return dispatcher.send(ip, action, level, msg)
+
+
+def alert_stats():
+    return dispatcher.snapshot()
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from functools import wraps
+
+from utils.metrics_utils import inc
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _count(name, field):
+    with _stats_lock:
+        _stats.setdefault(name, {"hits": 0, "misses": 0})[field] += 1
+    inc(f"primis_cache_{field}_total", function=name)
+
+
+def cached(sources=(), ttl=None, ready=None):
+    # Guarda o resultado enquanto os arquivos de origem não mudarem
+    # (inode, tamanho e mtime) e, se houver ttl, até ele expirar.
+    # sources pode ser uma função, para resolver os caminhos na hora da chamada;
+    # enquanto ready() for falso o resultado é parcial e não fica guardado
+    def decorator(fn):
+        name = fn.__name__
+        entries = {}
+        lock = threading.Lock()
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            paths = sources() if callable(sources) else sources
+            signature = tuple(file_signature(path) for path in paths)
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+
+            with lock:
+                entry = entries.get(key)
+            if entry is not None and entry[0] == signature and (entry[1] is None or now < entry[1]):
+                _count(name, "hits")
+                return entry[2]
+
+            _count(name, "misses")
+            value = fn(*args, **kwargs)
+            if ready is not None and not ready():
+                return value
+            with lock:
+                entries[key] = (signature, None if ttl is None else now + ttl, value)
+            return value
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
+
+def cache_stats():
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
@@ -1,8 +1,29 @@
+import bisect
 import json
+import os
+import re
+import secrets
+import shutil
 import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from flask import abort
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from utils.log_utils import register_log, recent_records, logs_loaded
+from utils.cache_utils import cached
+from utils.reload_utils import request_reload
+from utils.fs_utils import file_lock, atomic_write
+from utils.alert_utils import send_alert
+from utils.metrics_utils import inc, observe, register_collector, run
 
 
 OPENSSL_PATH = Path("/etc/ssl/server/openssl.cnf")
@@ -11,116 +32,434 @@ CLIENTS_JSON_PATH = CLIENTS_PATH / "clients.json"
 CA_PATH = Path("/etc/ssl/server/ca")
 CERTS_LOGPATH = "/var/log/certs.log"
 
+# "rsa" mantém o RSA 4096 de antes; "ec" (P-256) gera a chave em milissegundos
+CERT_KEY_TYPES = ("rsa", "ec")
+CERT_KEY_TYPE = "rsa"
+CERT_RSA_BITS = 4096
+CERT_DAYS = 365
+CERT_SUBJECT = {
+    NameOID.ORGANIZATION_NAME: "Clinica VidaMais",
+    NameOID.LOCALITY_NAME: "Palmital",
+    NameOID.STATE_OR_PROVINCE_NAME: "PR",
+    NameOID.COUNTRY_NAME: "BR",
+}
+CLIENT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+CERT_WORKERS = 2
+CERT_JOBS_KEPT = 100
+CERT_JOBS_PATH = Path("/var/lib/primislayer/cert_jobs")
+CERT_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+CERT_JOB_STALE = 600
+
+CERT_EXPIRY_WARN_DAYS = 30
+CERT_EXPIRY_CHECK_INTERVAL = 24 * 3600
+
+# Chaves geradas com antecedência, cifradas em disco; o nome começa com "."
+# e por isso nunca colide com um cliente (valid_client_name)
+KEY_POOL_DIR = ".pool"
+KEY_POOL_SIZE = int(os.environ.get("KEY_POOL_SIZE", "10"))
+KEY_POOL_LOW = int(os.environ.get("KEY_POOL_LOW", str(KEY_POOL_SIZE // 2)))
+KEY_POOL_TYPES = tuple(os.environ.get("KEY_POOL_TYPES", "rsa").split(","))
+# Se não vier do ambiente, a senha fica ao lado da chave da CA
+KEY_POOL_SECRET_FILE = "pool.secret"
+# Espera entre verificações quando há emissões em andamento
+KEY_POOL_IDLE_WAIT = 2.0
+KEY_POOL_RATE_WINDOW = 600
+# Retiradas feitas por outros workers não acordam a thread de recarga
+KEY_POOL_CHECK_INTERVAL = 30
+
 
 def log(path, msg):
     with open(path, "a") as f:
         f.write(str(datetime.now().strftime("%d/%m/%Y %H:%M:%S")) + " " + str(msg) + "\n")
 
    
+register_log("certs", CERTS_LOGPATH)
+
+
+@cached(sources=lambda: (CERTS_LOGPATH,), ready=lambda: logs_loaded("certs"))
 def get_certs_logs(lines=100):
-    with open(CERTS_LOGPATH, "r") as f:
-        logs = f.readlines()[-lines:]
-    return logs[::-1]
+    return recent_records("certs", lines)
 
 
-def list_client_certs():
+# Registro dos clientes: "clients" continua com os nomes ativos e "certs"
+# guarda os metadados de cada certificado, inclusive os revogados
+
+
+def read_clients_json():
     try:
         with open(CLIENTS_JSON_PATH, "r") as f:
-            reader = json.load(f)
-            return reader["clients"]
+            data = json.load(f)
     except FileNotFoundError:
         log(CERTS_LOGPATH, f"Arquivo {CLIENTS_JSON_PATH} não encontrado. Criando novo")
-        with open(CLIENTS_JSON_PATH, "w") as f:
-            json.dump({"clients": []}, f)
-        return []
+        data = {"clients": []}
+        atomic_write(CLIENTS_JSON_PATH, json.dumps(data))
+    data.setdefault("certs", {})
+    return data
+
+
+def cert_metadata(cert):
+    return {
+        "serial": f"{cert.serial_number:x}",
+        "fingerprint": cert.fingerprint(hashes.SHA256()).hex(":"),
+        "not_before": int(cert.not_valid_before_utc.timestamp()),
+        "not_after": int(cert.not_valid_after_utc.timestamp()),
+        "revoked": False,
+        "revoked_at": None,
+    }
+
+
+def read_cert_metadata(name):
+    try:
+        cert = x509.load_pem_x509_certificate((CLIENTS_PATH / name / "client.crt").read_bytes())
+    except (OSError, ValueError):
+        return None
+    return cert_metadata(cert)
+
+
+def fill_metadata(data):
+    # Clientes criados antes do registro: lê o client.crt uma vez
+    for name in data["clients"]:
+        if name not in data["certs"]:
+            metadata = read_cert_metadata(name)
+            if metadata is not None:
+                data["certs"][name] = metadata
+    return data
+
+
+@cached(sources=lambda: (CLIENTS_JSON_PATH,))
+def load_registry():
+    try:
+        data = fill_metadata(read_clients_json())
     except Exception as e:
         log(CERTS_LOGPATH, f"Erro inesperado ao ler {CLIENTS_JSON_PATH}: {str(e)}")
+        return None
+
+    active = set(data["clients"])
+    # Ordenado por vencimento para a busca dos que vencem em N dias
+    expiry = sorted(
+        (metadata["not_after"], name)
+        for name, metadata in data["certs"].items()
+        if name in active and not metadata["revoked"]
+    )
+    return {"clients": tuple(data["clients"]), "certs": data["certs"], "expiry": expiry}
+
+
+def update_registry(change):
+    # Leitura, alteração e escrita atômica sob o mesmo lock
+    with file_lock(CLIENTS_JSON_PATH):
+        data = fill_metadata(read_clients_json())
+        change(data)
+        atomic_write(CLIENTS_JSON_PATH, json.dumps(data))
+        return data
+
+
+def list_client_certs():
+    registry = load_registry()
+    if registry is None:
         return False
+    return list(registry["clients"])
 
 
-def delete_client_cert(name):
-    locations: list = list_client_certs()
-    if name not in locations:
-        return
+def client_registry():
+    registry = load_registry()
+    if registry is None:
+        return {}
+    return {name: dict(metadata) for name, metadata in registry["certs"].items()}
 
-    client_dir: Path = CLIENTS_PATH / name
-    crt_path = client_dir / "client.crt"
-    ca_crt = CA_PATH / "ca.crt"
-    ca_key = CA_PATH / "ca.key"
-    try:
-        revoke_resp = subprocess.run(
-            [
-                "openssl",
-                "ca",
-                "-revoke",
-                str(crt_path),
-                "-config",
-                str(OPENSSL_PATH),
-                "-keyfile",
-                str(ca_key),
-                "-cert",
-                str(ca_crt),
-                "-crl_reason",
-                "cessationOfOperation",
-            ],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
 
-        log(CERTS_LOGPATH, f"Certificado {name} revogado: {revoke_resp}")
+def expiring_client_certs(days=CERT_EXPIRY_WARN_DAYS):
+    # Inclui os já vencidos e ainda não revogados
+    registry = load_registry()
+    if registry is None:
+        return []
+
+    now = time.time()
+    end = bisect.bisect_right(registry["expiry"], (now + days * 86400, "\uffff"))
+    return [
+        {"name": name, **registry["certs"][name], "days_left": int((not_after - now) // 86400)}
+        for not_after, name in registry["expiry"][:end]
+    ]
 
-        crl_resp = subprocess.run(
-            [
-                "openssl",
-                "ca",
-                "-gencrl",
-                "-out",
-                str(CA_PATH / "crl.pem"),
-                "-config",
-                str(OPENSSL_PATH),
-                "-keyfile",
-                str(ca_key),
-                "-cert",
-                str(ca_crt),
-            ],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
 
-        log(CERTS_LOGPATH, f"CRL atualizado para certificado {name}: {crl_resp}")
+def check_expiring_certs():
+    certs = expiring_client_certs(CERT_EXPIRY_WARN_DAYS)
+    if certs:
+        names = ", ".join(f"{cert['name']} ({cert['days_left']}d)" for cert in certs)
+        send_alert("-", f"Certificados vencendo em até {CERT_EXPIRY_WARN_DAYS} dias", "Média", names)
+    return certs
 
-        subprocess.run(["nginx", "-s", "reload"], check=True)
 
+def _expiry_loop():
+    while True:
+        try:
+            check_expiring_certs()
+        except Exception as e:
+            log(CERTS_LOGPATH, f"Erro ao verificar vencimento dos certificados: {str(e)}")
+        time.sleep(CERT_EXPIRY_CHECK_INTERVAL)
+
+
+def start_expiry_alerts():
+    threading.Thread(target=_expiry_loop, name="certs-expiry", daemon=True).start()
+
+
+def openssl_ca(*args):
+    return run(
+        [
+            "openssl",
+            "ca",
+            *args,
+            "-config",
+            str(OPENSSL_PATH),
+            "-keyfile",
+            str(CA_PATH / "ca.key"),
+            "-cert",
+            str(CA_PATH / "ca.crt"),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def revoke_client_certs(names):
+    # Registra todas as revogações no index.txt, gera o CRL uma vez, faz um
+    # único reload e só então tira os clientes do clients.json de uma vez
+    results = []
+    revoked = []
+    with file_lock(CA_PATH / "index.txt"):
+        locations: list = list_client_certs()
+        for name in dict.fromkeys(names):
+            if name not in locations:
+                results.append({"name": name, "status": "inexistente"})
+                continue
+
+            crt_path = CLIENTS_PATH / name / "client.crt"
+            try:
+                revoke_resp = openssl_ca("-revoke", str(crt_path), "-crl_reason", "cessationOfOperation")
+                log(CERTS_LOGPATH, f"Certificado {name} revogado: {revoke_resp}")
+            except subprocess.CalledProcessError as e:
+                if "Already revoked" not in (e.stderr or ""):
+                    log(CERTS_LOGPATH, f"Erro ao revogar {name}: {e.stderr}")
+                    results.append({"name": name, "status": "erro", "error": (e.stderr or str(e)).strip()})
+                    continue
+                log(CERTS_LOGPATH, f"Certificado {name} já estava revogado")
+            except Exception as e:
+                log(CERTS_LOGPATH, f"Erro inesperado ao remover {name}: {str(e)}")
+                results.append({"name": name, "status": "erro", "error": str(e)})
+                continue
+            revoked.append(name)
+            results.append({"name": name, "status": "revogado"})
+
+        if not revoked:
+            return {"results": results, "crl": None, "reload": None}
+
+        try:
+            crl_resp = openssl_ca("-gencrl", "-out", str(CA_PATH / "crl.pem"))
+            log(CERTS_LOGPATH, f"CRL atualizado para {len(revoked)} certificado(s): {crl_resp}")
+            crl = "atualizado"
+        except Exception as e:
+            # As revogações já estão no index.txt e entram no próximo CRL gerado
+            log(CERTS_LOGPATH, f"Erro ao gerar o CRL: {str(e)}")
+            crl = "erro"
+
+    reload = request_reload() if crl == "atualizado" else None
+    log(CERTS_LOGPATH, f"Reload do nginx após revogar {', '.join(revoked)}: {reload}")
+
+    # Sem CRL novo carregado o nginx continua aceitando os certificados: o
+    # cliente fica no registro e no disco para a revogação ser repetida
+    if crl != "atualizado" or reload.get("status") not in ("ok", "validado"):
+        if crl != "atualizado":
+            error = "CRL não atualizado"
+        else:
+            error = f"Reload do nginx falhou: {reload.get('error', reload['status'])}"
+        for result in results:
+            if result["status"] == "revogado":
+                result.update(status="erro", error=f"{error}; tente revogar novamente")
+        return {"results": results, "crl": crl, "reload": reload}
+
+    def mark_revoked(data):
+        data["clients"] = [name for name in data["clients"] if name not in revoked]
+        for name in revoked:
+            if name in data["certs"]:
+                data["certs"][name].update(revoked=True, revoked_at=int(time.time()))
+
+    update_registry(mark_revoked)
+
+    for result in results:
+        if result["status"] != "revogado":
+            continue
+        client_dir: Path = CLIENTS_PATH / result["name"]
         try:
             for file in client_dir.glob("*"):
                 file.unlink()
             client_dir.rmdir()
-
-            locations.remove(name)
-            with open(CLIENTS_JSON_PATH, "w") as f:
-                json.dump({"clients": locations}, f)
-
-            return True
         except Exception as e:
             log(
                 CERTS_LOGPATH,
                 f"Erro inesperado ao remover o diretório {client_dir}: {str(e)}",
             )
+            result["error"] = str(e)
 
-    except Exception as e:
-        log(CERTS_LOGPATH, f"Erro inesperado ao remover {name}: {str(e)}")
+    return {"results": results, "crl": crl, "reload": reload}
 
 
-def add_client_cert(name):
-    locations: list = list_client_certs()
-    if name in locations:
-        log(f"Cliente {name} já existe. Ignorando criação.")
+def delete_client_cert(name):
+    result = revoke_client_certs([name])
+    if result["results"][0]["status"] == "revogado" and "error" not in result["results"][0]:
+        return True
+
+
+def valid_client_name(name):
+    return bool(CLIENT_NAME_PATTERN.match(name))
+
+
+def register_clients(names):
+    # Uma única escrita do clients.json para o lote inteiro
+    def add(data):
+        for name in dict.fromkeys(names):
+            if name not in data["clients"]:
+                data["clients"].append(name)
+            metadata = read_cert_metadata(name)
+            if metadata is not None:
+                data["certs"][name] = metadata
+
+    update_registry(add)
+
+
+def register_client(name):
+    register_clients([name])
+
+
+@cached(sources=lambda: (CA_PATH / "ca.crt", CA_PATH / "ca.key"))
+def load_ca():
+    ca_cert = x509.load_pem_x509_certificate((CA_PATH / "ca.crt").read_bytes())
+    ca_key = serialization.load_pem_private_key((CA_PATH / "ca.key").read_bytes(), password=None)
+    return ca_cert, ca_key
+
+
+def generate_key(key_type=CERT_KEY_TYPE):
+    if key_type == "ec":
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(public_exponent=65537, key_size=CERT_RSA_BITS)
+
+
+def build_client_cert(name, key, ca_cert, ca_key):
+    subject = x509.Name(
+        [x509.NameAttribute(NameOID.COMMON_NAME, name)]
+        + [x509.NameAttribute(oid, value) for oid, value in CERT_SUBJECT.items()]
+    )
+    now = datetime.now(timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(ca_cert.subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=CERT_DAYS))
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()), critical=False)
+        .sign(ca_key, hashes.SHA256())
+    )
+
+
+def export_p12(name, key, cert, ca_cert, password):
+    # 3DES/SHA1 em vez do AES padrão: Windows e macOS mais antigos só importam esse
+    encryption = (
+        serialization.PrivateFormat.PKCS12.encryption_builder()
+        .kdf_rounds(50000)
+        .key_cert_algorithm(pkcs12.PBES.PBESv1SHA1And3KeyTripleDESCBC)
+        .hmac_hash(hashes.SHA1())
+        .build(password.encode("utf-8"))
+    )
+    return pkcs12.serialize_key_and_certificates(name.encode("utf-8"), key, cert, [ca_cert], encryption)
+
+
+def claim_client_name(name):
+    # Reserva o nome criando o diretório do cliente sob o lock do clients.json:
+    # entre jobs e workers, só uma emissão por nome passa daqui
+    with file_lock(CLIENTS_JSON_PATH):
+        if name in read_clients_json()["clients"]:
+            return False
+        CLIENTS_PATH.mkdir(parents=True, exist_ok=True)
+        try:
+            (CLIENTS_PATH / name).mkdir(exist_ok=False)
+        except FileExistsError:
+            return False
+    return True
+
+
+def add_client_cert(name, password=None, key_type=CERT_KEY_TYPE, key=None, register=True, claimed=False):
+    # Emissão em processo com a biblioteca cryptography; devolve a senha do
+    # PKCS#12 quando ela foi gerada aqui
+    if not valid_client_name(name):
+        raise ValueError(f"Nome de cliente inválido: {name}")
+    if key_type not in CERT_KEY_TYPES:
+        raise ValueError(f"Tipo de chave inválido: {key_type}")
+    if not claimed and not claim_client_name(name):
+        log(CERTS_LOGPATH, f"Cliente {name} já existe. Ignorando criação.")
+        raise ValueError(f"Cliente {name} já existe")
+
+    client_dir: Path = CLIENTS_PATH / name
+    try:
+        return _issue_client_cert(name, client_dir, password, key_type, key, register)
+    except Exception:
+        # Libera o nome para uma nova tentativa
+        shutil.rmtree(client_dir, ignore_errors=True)
+        raise
+
+
+def _issue_client_cert(name, client_dir, password, key_type, key, register):
+    generated = password is None or password == ""
+    if generated:
+        password = secrets.token_urlsafe(12)
+
+    start = time.perf_counter()
+    pooled = False
+    if key is None:
+        key = key_pool.take(key_type)
+        pooled = key is not None
+    if key is None:
+        key = generate_key(key_type)
+    log(CERTS_LOGPATH, f"Chave privada {'retirada do pool' if pooled else 'gerada'} para {name}: {key_type}")
+
+    ca_cert, ca_key = load_ca()
+    cert = build_client_cert(name, key, ca_cert, ca_key)
+    log(CERTS_LOGPATH, f"Certificado assinado para {name}: serial {cert.serial_number:x}")
+
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()
+    )
+    atomic_write(client_dir / "client.key", key_pem)
+    os.chmod(client_dir / "client.key", 0o600)
+    atomic_write(client_dir / "client.crt", cert.public_bytes(serialization.Encoding.PEM))
+    atomic_write(client_dir / "client.p12", export_p12(name, key, cert, ca_cert, password))
+    log(CERTS_LOGPATH, f"Arquivo PKCS#12 gerado para {name}: {client_dir / 'client.p12'}")
+
+    if register:
+        register_client(name)
+        log(CERTS_LOGPATH, f"Cliente {name} adicionado com sucesso!")
+
+    return {
+        "name": name,
+        "key_type": key_type,
+        "pool": pooled,
+        "serial": f"{cert.serial_number:x}",
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        "password": password if generated else None,
+    }
+
+
+def add_client_cert_openssl(name, password):
+    # Implementação de referência com o openssl em subprocessos
+    if not claim_client_name(name):
+        log(CERTS_LOGPATH, f"Cliente {name} já existe. Ignorando criação.")
         return
 
     client_dir: Path = CLIENTS_PATH / name
-    client_dir.mkdir(parents=True, exist_ok=True)
 
     key_path = client_dir / "client.key"
     csr_path = client_dir / "client.csr"
@@ -130,10 +469,10 @@ def add_client_cert(name):
     subj = f"/CN={name}/O=Clinica VidaMais/L=Palmital/ST=PR/C=BR"
 
     try:
-        subprocess.run(["openssl", "genrsa", "-out", str(key_path), "4096"], check=True)
+        run(["openssl", "genrsa", "-out", str(key_path), "4096"], check=True)
         log(CERTS_LOGPATH, f"Chave privada gerada para {name}: {key_path}")
 
-        csr_resp = subprocess.run(
+        csr_resp = run(
             [
                 "openssl",
                 "req",
@@ -155,7 +494,7 @@ def add_client_cert(name):
             f"CSR gerado para {name}: {csr_resp.stdout if csr_resp.stdout else 'Sucesso'}",
         )
 
-        cert_resp = subprocess.run(
+        cert_resp = run(
             [
                 "openssl",
                 "x509",
@@ -182,7 +521,7 @@ def add_client_cert(name):
             f"Certificado assinado para {name}: {cert_resp.stdout if cert_resp.stdout else 'Sucesso'}",
         )
 
-        p12_resp = subprocess.run(
+        p12_resp = run(
             [
                 "openssl",
                 "pkcs12",
@@ -196,7 +535,7 @@ def add_client_cert(name):
                 "-certfile",
                 str(CA_PATH / "ca.crt"),
                 "-password",
-                "pass:1234",
+                f"pass:{password}",
             ],
             check=True,
             capture_output=True,
@@ -204,9 +543,7 @@ def add_client_cert(name):
         )
         log(CERTS_LOGPATH, f"Arquivo PKCS#12 gerado para {name}: {p12_path}")
 
-        locations.append(name)
-        with open(CLIENTS_JSON_PATH, "w") as f:
-            json.dump({"clients": locations}, f)
+        register_client(name)
         log(CERTS_LOGPATH, f"Cliente {name} adicionado com sucesso!")
 
         return True
@@ -215,6 +552,392 @@ def add_client_cert(name):
         log(CERTS_LOGPATH, f"Erro ao gerar certificado para {name}: {e.stderr}")
     except Exception as e:
         log(CERTS_LOGPATH, f"Erro inesperado ao adicionar {name}: {str(e)}")
+    shutil.rmtree(client_dir, ignore_errors=True)
+
+
+# Emissão em segundo plano
+
+
+def _without_passwords(result):
+    if not isinstance(result, dict):
+        return result
+    result = {key: value for key, value in result.items() if key != "password"}
+    if isinstance(result.get("results"), list):
+        result["results"] = [_without_passwords(item) for item in result["results"]]
+    return result
+
+
+class CertJobs:
+    # Cada job também vai para um arquivo em CERT_JOBS_PATH: com vários
+    # workers, o pedido que consulta o job pode cair em outro processo.
+    # As senhas dos .p12 ficam só no arquivo e saem na primeira consulta ao job
+    def __init__(self, workers=CERT_WORKERS, kept=CERT_JOBS_KEPT):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="certs")
+        self.jobs = OrderedDict()
+        self.kept = kept
+        self._lock = threading.Lock()
+
+    def _path(self, job_id):
+        return CERT_JOBS_PATH / f"{job_id}.json"
+
+    def _save(self, job):
+        CERT_JOBS_PATH.mkdir(parents=True, exist_ok=True)
+        path = self._path(job["id"])
+        # O resultado pode trazer a senha gerada do .p12
+        atomic_write(path, json.dumps(job))
+        os.chmod(path, 0o600)
+
+    def _load(self, path):
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _prune(self):
+        try:
+            files = sorted(CERT_JOBS_PATH.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+        except FileNotFoundError:
+            return
+        for path in files[self.kept:]:
+            path.unlink(missing_ok=True)
+            Path(f"{path}.lock").unlink(missing_ok=True)
+
+    def submit(self, name, fn, *args, **kwargs):
+        job = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "status": "pendente",
+            "created": int(time.time()),
+            "finished": None,
+            "result": None,
+            "error": None,
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+            while len(self.jobs) > self.kept:
+                self.jobs.popitem(last=False)
+            self._save(job)
+            self._prune()
+        self.pool.submit(self._run, job, fn, args, kwargs)
+        return dict(job)
+
+    def _run(self, job, fn, args, kwargs):
+        name = job["name"]
+        job["status"] = "executando"
+        self._save(job)
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            job["result"] = _without_passwords(result)
+            job["status"] = "concluido"
+        except Exception as e:
+            log(CERTS_LOGPATH, f"Erro ao gerar certificado para {name}: {str(e)}")
+            job["error"] = str(e)
+            job["status"] = "erro"
+        job["finished"] = int(time.time())
+        self._save({**job, "result": result})
+
+    def busy(self):
+        # Jobs de qualquer worker; um job parado há muito tempo é de um processo que morreu
+        limit = time.time() - CERT_JOB_STALE
+        return any(
+            job["status"] in ("pendente", "executando") and job["created"] >= limit
+            for job in self.list()
+        )
+
+    def get(self, job_id):
+        if not CERT_JOB_ID_PATTERN.match(job_id):
+            return None
+        with self._lock:
+            job = self.jobs.get(job_id)
+            job = dict(job) if job else None
+
+        path = self._path(job_id)
+        if not path.exists():
+            return job
+        # O lock garante que só um pedido, de qualquer worker, leva as senhas
+        with file_lock(path):
+            stored = self._load(path)
+            if stored is None:
+                return job
+            stripped = _without_passwords(stored["result"])
+            if stripped != stored["result"]:
+                self._save({**stored, "result": stripped})
+        return stored
+
+    def list(self):
+        with self._lock:
+            jobs = {job_id: dict(job) for job_id, job in self.jobs.items()}
+        try:
+            paths = list(CERT_JOBS_PATH.glob("*.json"))
+        except FileNotFoundError:
+            paths = []
+        for path in paths:
+            if path.stem not in jobs:
+                job = self._load(path)
+                if job:
+                    jobs[job["id"]] = {**job, "result": _without_passwords(job["result"])}
+        return sorted(jobs.values(), key=lambda job: job["created"], reverse=True)[: self.kept]
+
+
+cert_jobs = CertJobs()
+
+
+def submit_client_cert(name, password=None, key_type=CERT_KEY_TYPE):
+    if not valid_client_name(name):
+        raise ValueError(f"Nome de cliente inválido: {name}")
+    if key_type not in CERT_KEY_TYPES:
+        raise ValueError(f"Tipo de chave inválido: {key_type}")
+    if name in list_client_certs():
+        raise ValueError(f"Cliente {name} já existe")
+    return cert_jobs.submit(name, add_client_cert, name, password=password, key_type=key_type)
+
+
+def parse_cert_items(items):
+    # Aceita nomes soltos ou {"nome", "senha", "chave"}
+    parsed = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"nome": item}
+        if not isinstance(item, dict):
+            raise ValueError(f"Item inválido: {item}")
+        parsed.append({
+            "name": str(item.get("nome", "")),
+            "password": item.get("senha") or None,
+            "key_type": item.get("chave") or CERT_KEY_TYPE,
+        })
+    return parsed
+
+
+def issue_client_certs(items):
+    # Emite o lote inteiro e registra todos os novos clientes numa única
+    # escrita do clients.json; o nginx não precisa de reload para emissões
+    results = []
+    issued = []
+    existing = set(list_client_certs())
+
+    for item in items:
+        name = item["name"]
+        if not valid_client_name(name) or item["key_type"] not in CERT_KEY_TYPES:
+            results.append({"name": name, "status": "inválido"})
+            continue
+        if name in existing or not claim_client_name(name):
+            results.append({"name": name, "status": "existente"})
+            continue
+
+        existing.add(name)
+        try:
+            result = add_client_cert(name, item["password"], item["key_type"], register=False, claimed=True)
+        except Exception as e:
+            log(CERTS_LOGPATH, f"Erro ao gerar certificado para {name}: {str(e)}")
+            results.append({"name": name, "status": "erro", "error": str(e)})
+            continue
+        issued.append(name)
+        results.append({**result, "status": "emitido"})
+
+    if issued:
+        register_clients(issued)
+        log(CERTS_LOGPATH, f"Clientes adicionados em lote: {', '.join(issued)}")
+
+    return {"results": results}
+
+
+def submit_client_certs(items):
+    items = parse_cert_items(items)
+    return cert_jobs.submit(f"lote ({len(items)})", issue_client_certs, items)
+
+
+def get_cert_job(job_id):
+    return cert_jobs.get(job_id)
+
+
+def list_cert_jobs():
+    return cert_jobs.list()
+
+
+# Pool de chaves
+
+
+def key_pool_secret():
+    secret = os.environ.get("KEY_POOL_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+
+    path = CA_PATH / KEY_POOL_SECRET_FILE
+    with file_lock(path):
+        if not path.exists():
+            atomic_write(path, secrets.token_urlsafe(32))
+            os.chmod(path, 0o600)
+    return path.read_bytes().strip()
+
+
+class KeyPool:
+    def __init__(self, size=KEY_POOL_SIZE, low=KEY_POOL_LOW, key_types=KEY_POOL_TYPES):
+        self.size = size
+        self.low = low
+        self.key_types = [key_type for key_type in key_types if key_type in CERT_KEY_TYPES]
+        self.stats = {"gerados": 0, "retirados": 0, "faltas": 0, "descartados": 0}
+        self.generation_ms = {}
+        self.generated_at = deque()
+        self._secret = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def path(self, key_type):
+        return CLIENTS_PATH / KEY_POOL_DIR / key_type
+
+    def secret(self):
+        if self._secret is None:
+            self._secret = key_pool_secret()
+        return self._secret
+
+    def depth(self, key_type):
+        try:
+            return sum(1 for entry in os.scandir(self.path(key_type)) if entry.name.endswith(".pem"))
+        except FileNotFoundError:
+            return 0
+
+    def start(self):
+        with self._lock:
+            if self.size > 0 and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="key-pool", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def take(self, key_type):
+        # O pool é só um atalho: qualquer falha aqui devolve None e a chave é
+        # gerada na hora
+        if key_type not in self.key_types:
+            return None
+
+        directory = self.path(key_type)
+        try:
+            entries = sorted(entry.name for entry in os.scandir(directory) if entry.name.endswith(".pem"))
+            secret = self.secret() if entries else None
+        except OSError as e:
+            if not isinstance(e, FileNotFoundError):
+                log(CERTS_LOGPATH, f"Pool de chaves {key_type} indisponível: {str(e)}")
+            entries = []
+
+        key = None
+        for entry in entries:
+            # O rename é atômico: se outro processo pegou a mesma chave, tenta a próxima
+            claimed = directory / (entry + ".em-uso")
+            try:
+                os.rename(directory / entry, claimed)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                log(CERTS_LOGPATH, f"Chave do pool ignorada ({entry}): {str(e)}")
+                continue
+            try:
+                # A chave foi gerada e validada aqui; validar de novo custa ~400 ms no RSA 4096
+                key = serialization.load_pem_private_key(
+                    claimed.read_bytes(), password=secret, unsafe_skip_rsa_key_validation=True
+                )
+            except (OSError, ValueError, TypeError) as e:
+                log(CERTS_LOGPATH, f"Chave do pool descartada ({entry}): {str(e)}")
+                self.stats["descartados"] += 1
+                inc("primis_key_pool_discarded_total", key_type=key_type)
+                continue
+            finally:
+                try:
+                    claimed.unlink(missing_ok=True)
+                except OSError:
+                    pass
+            break
+
+        if key is None:
+            self.stats["faltas"] += 1
+            inc("primis_key_pool_misses_total", key_type=key_type)
+        else:
+            self.stats["retirados"] += 1
+            inc("primis_key_pool_taken_total", key_type=key_type)
+        self._wake.set()
+        return key
+
+    def _needs_refill(self):
+        return [key_type for key_type in self.key_types if self.depth(key_type) < self.size]
+
+    def _run(self):
+        while True:
+            self._wake.wait(KEY_POOL_CHECK_INTERVAL)
+            self._wake.clear()
+
+            # Só completa quando ficou abaixo do mínimo, e então enche até o tamanho
+            if not any(self.depth(key_type) <= self.low for key_type in self.key_types):
+                continue
+
+            while pending := self._needs_refill():
+                if cert_jobs.busy():
+                    # Não disputa CPU com uma emissão em andamento
+                    time.sleep(KEY_POOL_IDLE_WAIT)
+                    continue
+                for key_type in pending:
+                    try:
+                        self._generate(key_type)
+                    except Exception as e:
+                        log(CERTS_LOGPATH, f"Erro ao completar o pool de chaves {key_type}: {str(e)}")
+                        time.sleep(KEY_POOL_IDLE_WAIT)
+
+    def _generate(self, key_type):
+        start = time.perf_counter()
+        key = generate_key(key_type)
+        data = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.BestAvailableEncryption(self.secret()),
+        )
+        directory = self.path(key_type)
+        directory.mkdir(parents=True, exist_ok=True)
+        os.chmod(directory.parent, 0o700)
+        path = directory / f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.pem"
+        atomic_write(path, data)
+        os.chmod(path, 0o600)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        previous = self.generation_ms.get(key_type)
+        self.generation_ms[key_type] = elapsed if previous is None else previous * 0.8 + elapsed * 0.2
+        now = time.time()
+        self.generated_at.append(now)
+        while self.generated_at and self.generated_at[0] < now - KEY_POOL_RATE_WINDOW:
+            self.generated_at.popleft()
+        self.stats["gerados"] += 1
+        observe("primis_key_pool_generation_seconds", elapsed / 1000, key_type=key_type)
+
+    def snapshot(self):
+        now = time.time()
+        recent = sum(1 for ts in self.generated_at if ts >= now - KEY_POOL_RATE_WINDOW)
+        return {
+            **self.stats,
+            "tamanho": self.size,
+            "minimo": self.low,
+            "profundidade": {key_type: self.depth(key_type) for key_type in self.key_types},
+            "geracao_ms": {key_type: round(ms, 1) for key_type, ms in self.generation_ms.items()},
+            "recarga_por_minuto": round(recent * 60 / KEY_POOL_RATE_WINDOW, 2),
+            "ativo": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+key_pool = KeyPool()
+
+
+def start_key_pool():
+    key_pool.start()
+
+
+def _key_pool_gauges():
+    # A profundidade vem dos arquivos do pool, compartilhados por todos os workers
+    gauges = [("primis_key_pool_depth", {"key_type": key_type}, key_pool.depth(key_type)) for key_type in key_pool.key_types]
+    return gauges + [("primis_key_pool_size", {}, key_pool.size)]
+
+
+register_collector(_key_pool_gauges)
+
+
+def key_pool_stats():
+    return key_pool.snapshot()
 
 
 def get_client_p12_path(name):
@@ -0,0 +1,229 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from utils.log_utils import add_log_listener
+
+
+EVENTS_DB_PATH = Path("/var/lib/primislayer/events.db")
+EVENTS_RETENTION_DAYS = 30
+EVENTS_MAX_ROWS = 5_000_000
+RETENTION_INTERVAL = 600
+MAX_PER_PAGE = 1000
+
+logger = logging.getLogger(__name__)
+
+ACCESS_SOURCES = ("normal_access", "protected_access")
+ERROR_SOURCES = ("normal_errors", "protected_errors", "server_errors")
+FAIL2BAN_SOURCES = ("fail2ban",)
+EVENT_SOURCES = ACCESS_SOURCES + ERROR_SOURCES + FAIL2BAN_SOURCES
+
+ERROR_IP_PATTERN = re.compile(r"(?:client: |ip=)(\d+\.\d+\.\d+\.\d+)")
+ERROR_PATH_PATTERN = re.compile(r'(?:request: "\S+ (\S+)|uri=([^&,\s]+))')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    ip TEXT,
+    method TEXT,
+    status INTEGER,
+    path TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_ip_ts ON events (ip, ts);
+CREATE INDEX IF NOT EXISTS idx_events_status_ts ON events (status, ts);
+CREATE INDEX IF NOT EXISTS idx_events_path ON events (path);
+"""
+
+_writer = None
+_writer_lock = threading.Lock()
+_watermarks = {}
+_retention_thread = None
+
+
+def _connect():
+    conn = sqlite3.connect(str(EVENTS_DB_PATH), timeout=10, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        EVENTS_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _writer = _connect()
+        _writer.execute("PRAGMA journal_mode=WAL")
+        _writer.execute("PRAGMA synchronous=NORMAL")
+        _writer.executescript(SCHEMA)
+    return _writer
+
+
+# Conversão dos registros dos logs em linhas da tabela
+
+
+def _access_row(source, record):
+    return (record["ts"], source, record["ip"], record["method"], record["status"], record["url"], record["user_agent"])
+
+
+def _error_row(source, record):
+    message = record["message"]
+    ip = ERROR_IP_PATTERN.search(message)
+    path = ERROR_PATH_PATTERN.search(message)
+    return (
+        record["ts"],
+        source,
+        ip.group(1) if ip else None,
+        None,
+        None,
+        (path.group(1) or path.group(2)) if path else None,
+        message,
+    )
+
+
+def _fail2ban_row(source, record):
+    return (record["ts"], source, record["ip"], None, None, None, f"{record['name']}: {record['msg']}")
+
+
+def _skip_stored(conn, source, rows):
+    # Ao iniciar, os logs são semeados com um trecho que pode já ter sido
+    # gravado antes de o painel reiniciar. Descarta o que for anterior ao
+    # último segundo gravado e, dentro desse segundo, só as linhas que já
+    # estão no banco; a partir da primeira linha mais nova grava tudo
+    if source not in _watermarks:
+        last = conn.execute("SELECT MAX(ts) FROM events WHERE source = ?", (source,)).fetchone()[0]
+        stored = Counter(
+            tuple(row) for row in conn.execute(
+                "SELECT ts, source, ip, method, status, path, message FROM events WHERE source = ? AND ts = ?",
+                (source, last),
+            )
+        )
+        _watermarks[source] = (last, stored)
+
+    last, stored = _watermarks[source]
+    if last is None:
+        return rows
+
+    kept = []
+    for row in rows:
+        if row[0] > last:
+            kept.append(row)
+        elif row[0] == last:
+            if stored[row] > 0:
+                stored[row] -= 1
+            else:
+                kept.append(row)
+
+    if kept and kept[-1][0] > last:
+        _watermarks[source] = (None, None)
+    return kept
+
+
+def _store_records(source, to_row, records):
+    rows = [to_row(source, record) for record in records if record.get("ts") is not None]
+
+    with _writer_lock:
+        conn = _get_writer()
+        rows = _skip_stored(conn, source, rows)
+        if rows:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO events (ts, source, ip, method, status, path, message) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+
+def apply_retention(conn=None, now=None):
+    conn = conn or _get_writer()
+    now = time.time() if now is None else now
+    with conn:
+        conn.execute("DELETE FROM events WHERE ts < ?", (int(now - EVENTS_RETENTION_DAYS * 86400),))
+        # Os ids são crescentes, então os menores são os eventos mais antigos
+        conn.execute(
+            "DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?",
+            (EVENTS_MAX_ROWS,),
+        )
+
+
+def _retention_loop():
+    # Fora dos listeners: refresh_log roda nas threads dos pedidos
+    while True:
+        try:
+            with _writer_lock:
+                apply_retention()
+        except sqlite3.Error:
+            logger.exception("Erro ao aplicar a retenção de eventos")
+        time.sleep(RETENTION_INTERVAL)
+
+
+def _listener(source, to_row):
+    return lambda records: _store_records(source, to_row, records)
+
+
+def start_event_store():
+    global _retention_thread
+    for source in ACCESS_SOURCES:
+        add_log_listener(source, _listener(source, _access_row))
+    for source in ERROR_SOURCES:
+        add_log_listener(source, _listener(source, _error_row))
+    for source in FAIL2BAN_SOURCES:
+        add_log_listener(source, _listener(source, _fail2ban_row))
+
+    if _retention_thread is None or not _retention_thread.is_alive():
+        _retention_thread = threading.Thread(target=_retention_loop, name="events-retention", daemon=True)
+        _retention_thread.start()
+
+
+# Consulta paginada
+
+
+def search_events(ip=None, status=None, path=None, source=None, since=None, until=None, page=1, per_page=100):
+    per_page = max(1, min(int(per_page), MAX_PER_PAGE))
+    page = max(1, int(page))
+
+    conditions = []
+    params = []
+    if ip:
+        conditions.append("ip = ?")
+        params.append(ip)
+    if status is not None:
+        conditions.append("status = ?")
+        params.append(int(status))
+    if path:
+        # Intervalo em vez de LIKE para o prefixo usar o índice
+        conditions.append("path >= ? AND path < ?")
+        params += [path, path + "\U0010ffff"]
+    if source:
+        conditions.append("source = ?")
+        params.append(source)
+    if since is not None:
+        conditions.append("ts >= ?")
+        params.append(int(since))
+    if until is not None:
+        conditions.append("ts <= ?")
+        params.append(int(until))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT * FROM events {where} ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?"
+    params += [per_page + 1, (page - 1) * per_page]
+
+    if not EVENTS_DB_PATH.exists():
+        rows = []
+    else:
+        conn = _connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    return {
+        "events": [dict(row) for row in rows[:per_page]],
+        "page": page,
+        "per_page": per_page,
+        "has_more": len(rows) > per_page,
+    }
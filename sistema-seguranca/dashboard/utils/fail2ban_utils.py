@@ -1,27 +1,245 @@
+import ipaddress
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
+from utils.log_utils import register_log, recent_records, add_log_listener, refresh_log, logs_loaded
+from utils.cache_utils import cached
+from utils.metrics_utils import run, timed
 
 
 FAIL2BAN_LOG_PATH = "/var/log/fail2ban-actions.log"
+FAIL2BAN_JAIL = "nginx-4xx"
+# Mesmo nome do conjunto em action.d/ipset-ban.conf
+BAN_IPSET = "primis-ban"
+BAN_CHUNK = 1000
+BANS_CACHE_TTL = 5
+
+# Histórico de banimentos por IP e por /24, em contadores diários
+OFFENSE_RETENTION_DAYS = 30
+OFFENSE_DEFAULT_DAYS = 7
+
+# Mesma escada do bantime.increment do jail.local: 600s, 1h, 1d
+BANTIME_BASE = 600
+BANTIME_MULTIPLIERS = (1, 6, 144)
 
 
 def parse_fail2ban_log(line):
-    parts = line.strip().split(" - ")
+    # "<time> - <failures> - <ip> - <name> - <msg>"; a mensagem pode conter " - "
+    parts = line.strip().split(" - ", 4)
+    if len(parts) < 4:
+        return None
 
-    time_str, failures, ip, name, msg = parts
+    time_str, failures, ip, name = parts[:4]
     msg = parts[4] if len(parts) > 4 else ""
 
-    timestamp = datetime.fromtimestamp(int(time_str)).strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        ts = int(time_str)
+    except ValueError:
+        return None
+
+    timestamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+    return {"time": timestamp, "ts": ts, "failures": failures, "ip": ip, "name": name, "msg": msg}
+
+
+def subnet_of(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    prefix = 24 if address.version == 4 else 64
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+class OffenseIndex:
+    # Banimentos por dia para cada IP e cada sub-rede; a consulta dos últimos
+    # N dias soma no máximo OFFENSE_RETENTION_DAYS contadores
+    def __init__(self, retention_days=OFFENSE_RETENTION_DAYS):
+        self.retention_days = retention_days
+        self.ips = defaultdict(dict)
+        self.subnets = defaultdict(dict)
+        self._lock = threading.Lock()
+        self._last_evict = 0
+
+    @staticmethod
+    def _day(ts):
+        return int(ts) // 86400
+
+    def add(self, ts, ip):
+        day = self._day(ts)
+        if day <= self._day(time.time()) - self.retention_days:
+            return
+
+        days = self.ips[ip]
+        days[day] = days.get(day, 0) + 1
+        subnet = subnet_of(ip)
+        if subnet is not None:
+            days = self.subnets[subnet]
+            days[day] = days.get(day, 0) + 1
+
+    def add_records(self, records):
+        with self._lock:
+            for record in records:
+                self.add(record["ts"], record["ip"])
+            if time.time() - self._last_evict >= 3600:
+                self._evict()
+
+    def _evict(self):
+        self._last_evict = time.time()
+        limit = self._day(time.time()) - self.retention_days
+        for index in (self.ips, self.subnets):
+            for key in list(index):
+                days = index[key]
+                for day in [day for day in days if day <= limit]:
+                    del days[day]
+                if not days:
+                    del index[key]
+
+    def _count(self, index, key, days):
+        start = self._day(time.time()) - min(days, self.retention_days) + 1
+        with self._lock:
+            counts = index.get(key)
+            if not counts:
+                return 0
+            return sum(count for day, count in counts.items() if day >= start)
+
+    def ip_count(self, ip, days=OFFENSE_DEFAULT_DAYS):
+        return self._count(self.ips, ip, days)
+
+    def subnet_count(self, subnet, days=OFFENSE_DEFAULT_DAYS):
+        return self._count(self.subnets, subnet, days)
+
+    def top(self, days=OFFENSE_DEFAULT_DAYS, n=20, subnets=False):
+        index = self.subnets if subnets else self.ips
+        with self._lock:
+            keys = list(index)
+        counts = ((key, self._count(index, key, days)) for key in keys)
+        return sorted((item for item in counts if item[1]), key=lambda item: -item[1])[:n]
+
+
+def escalated_bantime(previous_bans):
+    step = min(previous_bans, len(BANTIME_MULTIPLIERS) - 1)
+    return BANTIME_BASE * BANTIME_MULTIPLIERS[step]
+
+
+# Lido desde o início para montar o histórico de reincidência
+register_log("fail2ban", FAIL2BAN_LOG_PATH, parse_fail2ban_log, from_start=True)
 
-    return {"time": timestamp, "failures": failures, "ip": ip, "name": name, "msg": msg}
+offense_index = OffenseIndex()
+add_log_listener("fail2ban", offense_index.add_records)
 
 
+@cached(sources=lambda: (FAIL2BAN_LOG_PATH,), ready=lambda: logs_loaded("fail2ban"))
 def get_fail2ban_logs(lines=100):
-    with open(FAIL2BAN_LOG_PATH, "r") as f:
-        logs = f.readlines()[-lines:][::-1]
+    return recent_records("fail2ban", lines)
+
+
+def offense_history(ip, days=OFFENSE_DEFAULT_DAYS):
+    refresh_log("fail2ban")
+    subnet = subnet_of(ip)
+    previous = offense_index.ip_count(ip, days)
+    return {
+        "ip": ip,
+        "dias": days,
+        "banimentos": previous,
+        "subrede": subnet,
+        "banimentos_subrede": offense_index.subnet_count(subnet, days) if subnet else 0,
+        "proximo_bantime": escalated_bantime(previous),
+    }
+
+
+def repeat_offenders(days=OFFENSE_DEFAULT_DAYS, n=20):
+    refresh_log("fail2ban")
+    return {
+        "dias": days,
+        "ips": [{"ip": ip, "banimentos": count} for ip, count in offense_index.top(days, n)],
+        "subredes": [{"subrede": subnet, "banimentos": count} for subnet, count in offense_index.top(days, n, subnets=True)],
+    }
+
+
+# Banimentos ativos: o conjunto ipset é a fonte de verdade do que está
+# bloqueado; banir e desbanir passam pelo fail2ban para manter o banco dele
+
+
+@timed()
+def parse_ipset_save(output):
+    # "add primis-ban 1.2.3.4 timeout 530"
+    now = int(time.time())
+    bans = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 3 or parts[0] != "add":
+            continue
+        timeout = int(parts[parts.index("timeout") + 1]) if "timeout" in parts else 0
+        bans.append({
+            "ip": parts[2],
+            "timeout": timeout,
+            "expires": now + timeout if timeout else None,
+        })
+    return bans
+
+
+@cached(ttl=BANS_CACHE_TTL)
+def list_active_bans():
+    result = run(["ipset", "save", BAN_IPSET], capture_output=True, text=True)
+    if result.returncode != 0:
+        # Conjunto ainda não criado: fail2ban não iniciou a jail
+        return []
+    return parse_ipset_save(result.stdout)
+
+
+def split_ips(ips):
+    valid = []
+    invalid = []
+    for ip in ips:
+        try:
+            valid.append(str(ipaddress.ip_address(str(ip).strip())))
+        except ValueError:
+            invalid.append(ip)
+    return valid, invalid
+
+
+def _fail2ban_client(command, ips, jail):
+    done = 0
+    errors = []
+    for i in range(0, len(ips), BAN_CHUNK):
+        chunk = ips[i:i + BAN_CHUNK]
+        result = run(
+            ["fail2ban-client", "set", jail, command, *chunk],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            errors.append(result.stderr.strip() or result.stdout.strip())
+        else:
+            done += len(chunk)
+    list_active_bans.cache_clear()
+    return done, errors
+
+
+def ban_ips(ips, jail=FAIL2BAN_JAIL):
+    valid, invalid = split_ips(ips)
+    # O fail2ban aplica o bantime.increment também aos banimentos manuais;
+    # devolve o tempo esperado de cada IP pelo histórico
+    refresh_log("fail2ban")
+    bantimes = {ip: escalated_bantime(offense_index.ip_count(ip)) for ip in valid}
+    done, errors = _fail2ban_client("banip", valid, jail)
+    return {"banidos": done, "invalidos": invalid, "erros": errors, "bantimes": bantimes}
+
+
+def unban_ips(ips, jail=FAIL2BAN_JAIL):
+    valid, invalid = split_ips(ips)
+    done, errors = _fail2ban_client("unbanip", valid, jail)
+    return {"desbanidos": done, "invalidos": invalid, "erros": errors}
+
+
+def export_bans():
+    return [ban["ip"] for ban in list_active_bans()]
 
-    formatted_logs = []
-    for line in logs:
-        formatted_logs.append(parse_fail2ban_log(line))
 
-    return formatted_logs
+def import_bans(text, jail=FAIL2BAN_JAIL):
+    # Um IP por linha; linhas vazias e comentários (#) são ignorados
+    ips = [line.split("#", 1)[0].strip() for line in text.splitlines()]
+    return ban_ips([ip for ip in ips if ip], jail)
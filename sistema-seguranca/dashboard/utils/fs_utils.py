@@ -0,0 +1,81 @@
+import errno
+import fcntl
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path):
+    # flock vale entre processos e também entre threads, já que cada uma
+    # abre o próprio descritor
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_leader_locks = {}
+
+
+def elect_leader(path, on_elected=None):
+    # Só um processo segura o lock; os outros esperam numa thread e assumem
+    # quando ele morrer (o kernel solta o flock). Não pode ser chamado antes
+    # de um fork: o filho herdaria o mesmo lock
+    elected = threading.Event()
+
+    def acquired(lock):
+        _leader_locks[str(path)] = lock
+        elected.set()
+        if on_elected is not None:
+            on_elected()
+
+    os.makedirs(os.path.dirname(str(path)) or ".", exist_ok=True)
+    lock = open(path, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        def wait():
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            acquired(lock)
+
+        threading.Thread(target=wait, name="leader-election", daemon=True).start()
+    else:
+        acquired(lock)
+    return elected
+
+
+def atomic_write(path, data):
+    path = str(path)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+
+        try:
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Arquivo montado individualmente pelo docker-compose não pode ser
+            # substituído por rename; grava no lugar, ainda sob o lock de quem chamou
+            if e.errno not in (errno.EBUSY, errno.EXDEV):
+                raise
+            with open(path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
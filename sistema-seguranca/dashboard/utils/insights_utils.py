@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from utils.topk_utils import SpaceSaving, merge_all
+
+
+# Janela: (duração em segundos, tamanho do bucket em segundos, formato do rótulo)
+WINDOWS = {
+    "1h": (3600, 60, "%H:%M"),
+    "24h": (24 * 3600, 3600, "%d/%m %H:00"),
+    "7d": (7 * 24 * 3600, 3600, "%d/%m %H:00"),
+}
+DEFAULT_WINDOW = "24h"
+
+MINUTE_RETENTION = 2 * 3600
+HOUR_RETENTION = 7 * 24 * 3600 + 3600
+
+# Dimensões acompanhadas com top-K em memória fixa por bucket
+HEAVY_HITTERS = ("ips", "subnets", "urls", "user_agents", "error_ips")
+NAXSI_HEAVY_HITTERS = ("rules", "targets", "urls", "ips")
+NAXSI_SAMPLES = 200
+CHART_TOP = 20
+
+
+def _traffic_bucket():
+    bucket = {"count": 0, "status": Counter()}
+    for dimension in HEAVY_HITTERS:
+        bucket[dimension] = SpaceSaving()
+    return bucket
+
+
+def _naxsi_bucket():
+    bucket = {"count": 0, "learning": 0, "zones": Counter(), "origins": Counter()}
+    for dimension in NAXSI_HEAVY_HITTERS:
+        bucket[dimension] = SpaceSaving()
+    return bucket
+
+
+def _chart(summary, n=CHART_TOP):
+    top = summary.top(n)
+    return {
+        "labels": [key for key, _, _ in top],
+        "values": [count for _, count, _ in top],
+        "errors": [error for _, _, error in top],
+    }
+
+
+class BucketAggregator:
+    # Contadores por minuto e por hora, atualizados a cada linha nova e
+    # descartados quando saem da maior janela; new_bucket cria um bucket vazio
+    def __init__(self, new_bucket):
+        self._new_bucket = new_bucket
+        self._minutes = {}
+        self._hours = {}
+        self._lock = threading.Lock()
+        self._last_evict = 0
+
+    def _buckets_for(self, ts):
+        now = time.time()
+        if ts < now - HOUR_RETENTION:
+            return []
+
+        if now - self._last_evict >= 60:
+            self._evict(now)
+
+        found = []
+        for buckets, size in ((self._minutes, 60), (self._hours, 3600)):
+            key = int(ts) - int(ts) % size
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = self._new_bucket()
+            found.append(bucket)
+        return found
+
+    def _evict(self, now):
+        self._last_evict = now
+        for buckets, retention in ((self._minutes, MINUTE_RETENTION), (self._hours, HOUR_RETENTION)):
+            limit = now - retention
+            for key in [key for key in buckets if key < limit]:
+                del buckets[key]
+
+    def _window(self, window, now=None):
+        # Buckets da janela em ordem, com os rótulos do eixo de tempo
+        span, size, label_fmt = WINDOWS[window]
+        now = time.time() if now is None else now
+        start = int(now - span) - int(now - span) % size
+        buckets = self._minutes if size == 60 else self._hours
+
+        keys = sorted(key for key in buckets if key >= start)
+        labels = [datetime.fromtimestamp(key).strftime(label_fmt) for key in keys]
+        return labels, [buckets[key] for key in keys]
+
+
+class TrafficAggregator(BucketAggregator):
+    def __init__(self):
+        super().__init__(_traffic_bucket)
+
+    def add(self, ts, ip, status, url="", user_agent=""):
+        status_class = f"{status // 100}xx"
+        subnet = ip.rsplit(".", 1)[0] + ".0/24"
+        path = url.split("?", 1)[0]
+        for bucket in self._buckets_for(ts):
+            bucket["count"] += 1
+            bucket["status"][status_class] += 1
+            bucket["ips"].add(ip)
+            bucket["subnets"].add(subnet)
+            bucket["urls"].add(path)
+            bucket["user_agents"].add(user_agent)
+            if 400 <= status < 500:
+                bucket["error_ips"].add(ip)
+
+    def add_records(self, records):
+        with self._lock:
+            for record in records:
+                ts = record.get("ts")
+                if ts is None:
+                    continue
+                self.add(ts, record["ip"], record["status"], record["url"], record["user_agent"])
+
+    def insights(self, window=DEFAULT_WINDOW, now=None):
+        status_count = Counter()
+
+        with self._lock:
+            labels, selected = self._window(window, now)
+            values = [bucket["count"] for bucket in selected]
+            for bucket in selected:
+                status_count.update(bucket["status"])
+            heavy = {dimension: merge_all(bucket[dimension] for bucket in selected) for dimension in HEAVY_HITTERS}
+
+        status_items = sorted(status_count.items())
+
+        return {
+            "window": window,
+            "total": sum(values),
+            "hourly_access": {"labels": labels, "values": values},
+            "status_access": {"labels": [k for k, _ in status_items], "values": [v for _, v in status_items]},
+            "ip_access": _chart(heavy["ips"]),
+            "subnet_access": _chart(heavy["subnets"]),
+            "url_access": _chart(heavy["urls"]),
+            "agent_access": _chart(heavy["user_agents"]),
+            "error_ip_access": _chart(heavy["error_ips"]),
+        }
+
+
+class NaxsiAggregator(BucketAggregator):
+    # Eventos do WAF por regra, zona, alvo (regra + zona + variável), URL e IP
+    def __init__(self):
+        super().__init__(_naxsi_bucket)
+        self.samples = deque(maxlen=NAXSI_SAMPLES)
+
+    def add_events(self, events):
+        with self._lock:
+            for event in events:
+                # NAXSI_EXLOG repete a regra do NAXSI_FMT com o conteúdo que
+                # casou; serve de amostra, não entra na contagem
+                if event["kind"] == "NAXSI_EXLOG":
+                    self.samples.append(event)
+                    continue
+
+                for bucket in self._buckets_for(event["ts"]):
+                    bucket["count"] += 1
+                    bucket["learning"] += event["learning"]
+                    bucket["origins"][event["origin"]] += 1
+                    bucket["ips"].add(event["ip"])
+                    bucket["urls"].add(event["uri"])
+                    for match in event["matches"]:
+                        bucket["rules"].add(str(match["id"]))
+                        bucket["zones"][match["zone"]] += 1
+                        bucket["targets"].add(f"{match['id']} {match['zone']}:{match['var_name']}")
+
+    def insights(self, window=DEFAULT_WINDOW, now=None):
+        zones = Counter()
+        origins = Counter()
+
+        with self._lock:
+            labels, selected = self._window(window, now)
+            learning = [bucket["learning"] for bucket in selected]
+            blocked = [bucket["count"] - bucket["learning"] for bucket in selected]
+            for bucket in selected:
+                zones.update(bucket["zones"])
+                origins.update(bucket["origins"])
+            heavy = {dimension: merge_all(bucket[dimension] for bucket in selected) for dimension in NAXSI_HEAVY_HITTERS}
+            samples = list(reversed(self.samples))
+
+        zone_items = zones.most_common()
+
+        return {
+            "window": window,
+            "total": sum(blocked) + sum(learning),
+            "learning": sum(learning),
+            "origins": dict(origins),
+            "timeline": {"labels": labels, "blocked": blocked, "learning": learning},
+            "zone_events": {"labels": [k for k, _ in zone_items], "values": [v for _, v in zone_items]},
+            "rule_events": _chart(heavy["rules"]),
+            "target_events": _chart(heavy["targets"]),
+            "url_events": _chart(heavy["urls"]),
+            "ip_events": _chart(heavy["ips"]),
+            "samples": samples,
+        }
@@ -0,0 +1,324 @@
+import os
+import logging
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from utils.metrics_utils import inc
+
+
+TAIL_BLOCK_SIZE = 64 * 1024
+# Leitura incremental em blocos: a carga inicial pode ter dias de log
+READ_CHUNK_SIZE = 8 * 1024 * 1024
+INGEST_INTERVAL = 1.0
+BUFFER_MAXLEN = 1000
+
+logger = logging.getLogger(__name__)
+
+
+# Funções para leitura de logs
+
+
+def _tail_from(f, end, lines, block_size=TAIL_BLOCK_SIZE):
+    # Lê o arquivo de trás para frente em blocos até ter linhas suficientes,
+    # sem carregar o arquivo inteiro na memória
+    if lines <= 0:
+        return []
+
+    pos = end
+    blocks = []
+    newlines = 0
+
+    while pos > 0 and newlines <= lines:
+        size = min(block_size, pos)
+        pos -= size
+        f.seek(pos)
+        block = f.read(size)
+        blocks.append(block)
+        newlines += block.count(b"\n")
+
+    history = b"".join(reversed(blocks)).splitlines(keepends=True)
+
+    # A primeira linha do bloco mais antigo pode estar cortada no meio
+    if pos > 0 and history:
+        history = history[1:]
+
+    return [line.decode("utf-8", errors="replace") for line in history[-lines:]]
+
+
+def _dated_line_after(f, pos, end, line_ts):
+    # Início e horário da primeira linha com data a partir da posição pos
+    if pos > 0:
+        f.seek(pos - 1)
+        f.readline()
+    else:
+        f.seek(0)
+
+    while f.tell() < end:
+        start = f.tell()
+        line = f.readline()
+        ts = line_ts(line.decode("utf-8", errors="replace"))
+        if ts is not None:
+            return start, ts
+    return end, None
+
+
+def offset_since(f, end, since, line_ts):
+    # Busca binária pela primeira linha com horário >= since; os logs são
+    # gravados em ordem de tempo, então bastam poucas leituras
+    lo, hi = 0, end
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _, ts = _dated_line_after(f, mid, end, line_ts)
+        if ts is not None and ts < since:
+            lo = mid + 1
+        else:
+            hi = mid
+    return _dated_line_after(f, lo, end, line_ts)[0]
+
+
+def read_appended(filepath, offset=0, inode=None, max_bytes=None):
+    # Leitura sem estado: quem chama guarda offset e inode entre as chamadas.
+    # Devolve só linhas completas; em rotação ou truncamento volta ao início
+    with open(filepath, "rb") as f:
+        st = os.fstat(f.fileno())
+        if st.st_ino != inode or st.st_size < offset:
+            offset = 0
+
+        f.seek(offset)
+        data = f.read() if max_bytes is None else f.read(max_bytes)
+
+    end = data.rfind(b"\n") + 1
+    lines = [line.decode("utf-8", errors="replace") + "\n" for line in data[:end].split(b"\n")[:-1]]
+    return lines, offset + end, st.st_ino
+
+
+# Ingestão incremental dos logs
+
+
+class LogFollower:
+    # Acompanha um arquivo de log como o "tail -F": guarda o offset e o inode,
+    # lê apenas o que foi acrescentado e reabre o arquivo em rotação/truncamento
+    def __init__(
+        self, filepath, parser=None, maxlen=BUFFER_MAXLEN, seed_lines=None, batch_parser=None, from_start=False, name=None,
+        seed_since=None, line_ts=None,
+    ):
+        self.filepath = str(filepath)
+        self.name = name or os.path.basename(self.filepath)
+        self.parser = parser
+        self.batch_parser = batch_parser
+        self.records = deque(maxlen=maxlen)
+        self.seed_lines = maxlen if seed_lines is None else seed_lines
+        # Lê o arquivo inteiro na primeira abertura em vez de só o final
+        self.from_start = from_start
+        # Ou, com line_ts, tudo o que foi gravado nos últimos seed_since segundos
+        self.seed_since = seed_since
+        self.line_ts = line_ts
+        # Vira True quando a carga inicial termina
+        self.loaded = False
+
+        self.listeners = []
+
+        self._file = None
+        self._inode = None
+        self._partial = b""
+        self._lock = threading.Lock()
+        # Separado do _lock para a leitura dos registros não esperar o parse
+        self._records_lock = threading.Lock()
+
+    def _open(self, seed):
+        self._file = open(self.filepath, "rb")
+        st = os.fstat(self._file.fileno())
+        self._inode = st.st_ino
+        self._partial = b""
+
+        if not seed or self.from_start:
+            return []
+
+        if self.seed_since is not None:
+            self._file.seek(offset_since(self._file, st.st_size, time.time() - self.seed_since, self.line_ts))
+            return []
+
+        # Na primeira abertura carrega só o final do arquivo
+        lines = _tail_from(self._file, st.st_size, self.seed_lines)
+        self._file.seek(st.st_size)
+        if lines and not lines[-1].endswith("\n"):
+            self._partial = lines.pop().encode("utf-8")
+        inc("primis_log_bytes_total", sum(map(len, lines)), log=self.name)
+        return lines
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def _read_new(self):
+        # Devolve as linhas completas e se o bloco veio cheio (há mais a ler)
+        chunk = self._file.read(READ_CHUNK_SIZE)
+        more = len(chunk) == READ_CHUNK_SIZE
+        if chunk:
+            inc("primis_log_bytes_total", len(chunk), log=self.name)
+        data = self._partial + chunk
+        complete, sep, rest = data.rpartition(b"\n")
+        if not sep:
+            self._partial = data
+            return [], more
+
+        self._partial = rest
+        return [line.decode("utf-8", errors="replace") + "\n" for line in complete.split(b"\n")], more
+
+    def _parse(self, lines):
+        if self.batch_parser is not None:
+            return self.batch_parser(lines)
+
+        parsed = []
+        for line in lines:
+            if self.parser is None:
+                parsed.append(line)
+                continue
+            try:
+                record = self.parser(line)
+            except ValueError:
+                continue
+            if record is not None:
+                parsed.append(record)
+        return parsed
+
+    def _consume(self, lines):
+        if not lines:
+            return 0
+        start = time.perf_counter()
+        parsed = self._parse(lines)
+        inc("primis_log_lines_total", len(lines), log=self.name)
+        inc("primis_log_parse_seconds_total", time.perf_counter() - start, log=self.name)
+        with self._records_lock:
+            self.records.extend(parsed)
+        self._notify(parsed)
+        return len(parsed)
+
+    def _poll_chunk(self):
+        # Lê e repassa um bloco; devolve os registros lidos e se há mais a ler
+        if self._file is None:
+            try:
+                return self._consume(self._open(seed=True)), True
+            except FileNotFoundError:
+                return 0, False
+
+        lines, more = self._read_new()
+        count = self._consume(lines)
+        if more:
+            return count, True
+        self.loaded = True
+
+        try:
+            st = os.stat(self.filepath)
+        except FileNotFoundError:
+            # Arquivo rotacionado e o novo ainda não foi criado
+            return count, False
+
+        if st.st_ino != self._inode:
+            self._close()
+            self._open(seed=False)
+            return count, True
+        if st.st_size < self._file.tell():
+            self._file.seek(0)
+            self._partial = b""
+            return count, True
+        return count, False
+
+    def poll(self):
+        # Devolve quantos registros novos foram lidos. O lock vale por bloco:
+        # durante a carga inicial de dias de log os registros já lidos
+        # continuam acessíveis
+        count = 0
+        more = True
+        while more:
+            with self._lock:
+                read, more = self._poll_chunk()
+            count += read
+        return count
+
+    def _notify(self, parsed):
+        if not parsed:
+            return
+        for listener in self.listeners:
+            try:
+                listener(parsed)
+            except Exception:
+                logger.exception("Erro ao processar registros de %s", self.filepath)
+
+    def recent(self, lines=100):
+        with self._records_lock:
+            return list(islice(reversed(self.records), lines))
+
+
+_followers = {}
+_ingest_thread = None
+
+
+def register_log(
+    name, filepath, parser=None, maxlen=BUFFER_MAXLEN, seed_lines=None, batch_parser=None, from_start=False,
+    seed_since=None, line_ts=None,
+):
+    follower = LogFollower(
+        filepath, parser=parser, maxlen=maxlen, seed_lines=seed_lines, batch_parser=batch_parser, from_start=from_start,
+        name=name, seed_since=seed_since, line_ts=line_ts,
+    )
+    _followers[name] = follower
+    return follower
+
+
+def get_follower(name):
+    return _followers[name]
+
+
+def add_log_listener(name, listener):
+    # O listener recebe a lista de registros novos a cada leitura do log
+    _followers[name].listeners.append(listener)
+
+
+def ingestion_running():
+    return _ingest_thread is not None and _ingest_thread.is_alive()
+
+
+def poll_logs():
+    for name, follower in list(_followers.items()):
+        try:
+            follower.poll()
+        except Exception:
+            logger.exception("Erro ao ler o log %s", name)
+
+
+def _ingest_loop(interval):
+    while True:
+        poll_logs()
+        time.sleep(interval)
+
+
+def start_ingestion(interval=INGEST_INTERVAL):
+    global _ingest_thread
+    if ingestion_running():
+        return _ingest_thread
+
+    _ingest_thread = threading.Thread(target=_ingest_loop, args=(interval,), name="log-ingest", daemon=True)
+    _ingest_thread.start()
+    return _ingest_thread
+
+
+def logs_loaded(*names):
+    return all(_followers[name].loaded for name in names)
+
+
+def refresh_log(name):
+    # Lê na hora o que houver de novo, para o resultado refletir o arquivo
+    # mesmo entre duas passadas da thread de ingestão. A carga inicial fica
+    # com a thread de ingestão: até ela terminar, vale o que já foi lido
+    follower = _followers[name]
+    if follower.loaded or not ingestion_running():
+        follower.poll()
+    return follower
+
+
+def recent_records(name, lines=100):
+    return refresh_log(name).recent(lines)
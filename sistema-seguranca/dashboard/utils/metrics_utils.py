@@ -0,0 +1,291 @@
+import bisect
+import json
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from utils.fs_utils import atomic_write
+
+
+# Cada worker guarda as próprias métricas em memória; quando alguém está
+# coletando, elas também vão para um arquivo por processo neste diretório e
+# o /metrics soma os arquivos de todos os workers
+METRICS_PATH = Path(os.environ.get("METRICS_PATH", "/run/primislayer/metrics"))
+METRICS_FLUSH_INTERVAL = 15
+# Sem coleta nesse intervalo, os workers param de gravar o arquivo
+METRICS_ACTIVE_WINDOW = 300
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Nome, tipo e descrição de cada métrica exportada
+METRICS = {
+    "primis_http_request_seconds": ("histogram", "Latência das rotas do painel"),
+    "primis_function_seconds": ("histogram", "Tempo das funções instrumentadas (sem acertos de cache)"),
+    "primis_external_seconds": ("histogram", "Duração de comandos externos e chamadas ao Telegram"),
+    "primis_external_total": ("counter", "Comandos externos por resultado (código de saída ou status HTTP)"),
+    "primis_log_bytes_total": ("counter", "Bytes lidos de cada log"),
+    "primis_log_lines_total": ("counter", "Linhas lidas de cada log"),
+    "primis_log_parse_seconds_total": ("counter", "Tempo gasto interpretando as linhas de cada log"),
+    "primis_nginx_reload_seconds": ("histogram", "Duração do nginx -t e do reload"),
+    "primis_nginx_reload_requests_total": ("counter", "Pedidos de reload, antes do agrupamento"),
+    "primis_cache_hits_total": ("counter", "Acertos de cache por função"),
+    "primis_cache_misses_total": ("counter", "Faltas de cache por função"),
+    "primis_key_pool_depth": ("gauge", "Chaves prontas no pool, por tipo"),
+    "primis_key_pool_size": ("gauge", "Tamanho alvo do pool de chaves"),
+    "primis_key_pool_generation_seconds": ("histogram", "Geração de cada chave do pool (a taxa de _count é a recarga)"),
+    "primis_key_pool_taken_total": ("counter", "Chaves retiradas do pool na emissão"),
+    "primis_key_pool_misses_total": ("counter", "Emissões que não encontraram chave no pool"),
+    "primis_key_pool_discarded_total": ("counter", "Chaves do pool descartadas por erro de leitura"),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_flush_thread = None
+_collectors = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, buckets=DEFAULT_BUCKETS, **labels):
+    key = _key(name, labels)
+    index = bisect.bisect_left(buckets, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0.0}
+        histogram["counts"][index] += 1
+        histogram["sum"] += seconds
+
+
+@contextmanager
+def timing(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(function=None):
+    # Histograma primis_function_seconds com o nome da função como rótulo
+    def decorator(fn):
+        label = function or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe("primis_function_seconds", time.perf_counter() - start, function=label)
+
+        return wrapper
+
+    return decorator
+
+
+def command_label(args):
+    if isinstance(args, (str, bytes)):
+        args = str(args).split()
+    program = os.path.basename(str(args[0]))
+    # "python3 /opt/nxutil/nx_util.py ..." vira "nx_util"
+    if program.startswith("python") and len(args) > 1:
+        return os.path.splitext(os.path.basename(str(args[1])))[0]
+    return program
+
+
+def record_external(command, status, seconds):
+    observe("primis_external_seconds", seconds, command=command)
+    inc("primis_external_total", command=command, status=status)
+
+
+def run(args, **kwargs):
+    # subprocess.run com duração e código de saída registrados
+    command = command_label(args)
+    start = time.perf_counter()
+    status = "erro"
+    try:
+        result = subprocess.run(args, **kwargs)
+        status = result.returncode
+        return result
+    except subprocess.CalledProcessError as e:
+        status = e.returncode
+        raise
+    finally:
+        record_external(command, status, time.perf_counter() - start)
+
+
+def register_collector(fn):
+    # fn() devolve [(nome, rótulos, valor)] de gauges calculados na hora da
+    # coleta, só no processo que atende o /metrics: valores que vêm do disco
+    # e seriam contados uma vez por worker se fossem somados
+    _collectors.append(fn)
+
+
+# Exportação
+
+
+def snapshot():
+    with _lock:
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in _counters.items()],
+            "histograms": [
+                [name, labels, h["buckets"], list(h["counts"]), h["sum"]] for (name, labels), h in _histograms.items()
+            ],
+        }
+
+
+def _flush():
+    METRICS_PATH.mkdir(parents=True, exist_ok=True)
+    atomic_write(METRICS_PATH / f"{os.getpid()}.json", json.dumps(snapshot()))
+
+
+def _scraped_recently():
+    try:
+        return time.time() - os.stat(METRICS_PATH / "scrape").st_mtime < METRICS_ACTIVE_WINDOW
+    except FileNotFoundError:
+        return False
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        # Ninguém coletando: nada é gravado
+        if _scraped_recently():
+            try:
+                _flush()
+            except OSError:
+                pass
+
+
+def start_metrics():
+    global _flush_thread
+    if _flush_thread is None or not _flush_thread.is_alive():
+        _flush_thread = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+        _flush_thread.start()
+
+
+def _worker_snapshots():
+    try:
+        METRICS_PATH.mkdir(parents=True, exist_ok=True)
+        (METRICS_PATH / "scrape").touch()
+        _flush()
+    except OSError:
+        return [snapshot()]
+
+    snapshots = []
+    for path in METRICS_PATH.glob("*.json"):
+        try:
+            pid = int(path.stem)
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            # Worker que já morreu
+            path.unlink(missing_ok=True)
+            continue
+        except (ValueError, PermissionError):
+            continue
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merged_metrics():
+    counters = {}
+    histograms = {}
+    snapshots = _worker_snapshots()
+    for data in snapshots:
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total in data["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            current = histograms.get(key)
+            if current is None or current[0] != buckets:
+                histograms[key] = [buckets, list(counts), total]
+                continue
+            current[1] = [a + b for a, b in zip(current[1], counts)]
+            current[2] += total
+    return counters, histograms, len(snapshots)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def render():
+    # Formato texto do Prometheus (0.0.4)
+    counters, histograms, workers = merged_metrics()
+    gauges = []
+    for collect in _collectors:
+        try:
+            gauges += [(name, _key(name, labels)[1], value) for name, labels, value in collect()]
+        except Exception:
+            continue
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "gauge":
+            for metric, labels, value in sorted(gauges):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            continue
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            continue
+
+        for (metric, labels), (buckets, counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    # Linhas por segundo de interpretação, já calculado para quem só olha o /metrics
+    lines.append("# HELP primis_log_parse_lines_per_second Linhas interpretadas por segundo de CPU em cada log")
+    lines.append("# TYPE primis_log_parse_lines_per_second gauge")
+    for (metric, labels), seconds in sorted(counters.items()):
+        if metric == "primis_log_parse_seconds_total" and seconds > 0:
+            parsed = counters.get(("primis_log_lines_total", labels), 0)
+            lines.append(f"primis_log_parse_lines_per_second{_labels(labels)} {_number(parsed / seconds)}")
+
+    lines.append("# HELP primis_workers Processos do painel somados nesta coleta")
+    lines.append("# TYPE primis_workers gauge")
+    lines.append(f"primis_workers {workers}")
+    return "\n".join(lines) + "\n"
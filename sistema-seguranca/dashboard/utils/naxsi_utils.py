@@ -1,10 +1,35 @@
+import json
+import logging
+import re
 import subprocess
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from utils.reload_utils import request_reload
+from utils.log_utils import read_appended
+from utils.fs_utils import atomic_write, file_lock
+from utils.cache_utils import cached, file_signature
+from utils.metrics_utils import inc, run, timed
 
 WHITELIST_PATH = "/etc/nginx/generated.wl"
 NAXSI_LOGPATH = "/var/log/nginx/normal_error.log"
 NXUTIL_PATH = "/opt/nxutil/nx_util.py"
 MAIN_RULES = "/etc/nginx/naxsi.rules"
 
+# Contagens agregadas e offset já lido do log, para não reprocessar tudo a cada pedido
+NAXSI_STATE_PATH = Path("/var/lib/primislayer/naxsi_learning.json")
+NAXSI_READ_CHUNK = 8 * 1024 * 1024
+# Mesmo limiar do "-p 1" passado ao nx_util: páginas mínimas para sugerir a regra
+NAXSI_PAGES_HIT = 1
+# A partir de quantas páginas a whitelist deixa de ser por URL
+NAXSI_GLOBAL_PAGES = 5
+
+# URL e nome da variável vêm da requisição e vão parar no generated.wl
+UNSAFE_MZ_CHARS = re.compile(r'[\s"|;{}$\\]')
+
+logger = logging.getLogger(__name__)
+
 
 def get_naxsi_whitelist():
     with open(WHITELIST_PATH, "r") as f:
@@ -16,6 +41,7 @@ def get_naxsi_rules():
         return f.readlines()
 
 
+@cached(sources=lambda: (MAIN_RULES,))
 def learning_mode_active():
     rules = get_naxsi_rules()
     if any("LearningMode;" in line for line in rules):
@@ -24,30 +50,230 @@ def learning_mode_active():
 
 
 def activate_learning_mode():
-    rules = get_naxsi_rules()
-    if any("LearningMode;" in line for line in rules):
-        raise Exception("Learning mode já ativado")
-    
-    rules.insert(0, "LearningMode;\n")
-    
-    with open(MAIN_RULES, "w") as f:
-        f.writelines(rules)
-    
-    nginx_reload()
+    with file_lock(MAIN_RULES):
+        rules = get_naxsi_rules()
+        if any("LearningMode;" in line for line in rules):
+            raise Exception("Learning mode já ativado")
 
+        rules.insert(0, "LearningMode;\n")
+        atomic_write(MAIN_RULES, "".join(rules))
 
-def deactivate_learning_mode():
-    rules = get_naxsi_rules()
-    rules = [line for line in rules if "LearningMode;" not in line]
+    return nginx_reload()
 
-    with open(MAIN_RULES, "w") as f:
-        f.writelines(rules)
 
-    nginx_reload()
+def deactivate_learning_mode():
+    with file_lock(MAIN_RULES):
+        rules = get_naxsi_rules()
+        rules = [line for line in rules if "LearningMode;" not in line]
+        atomic_write(MAIN_RULES, "".join(rules))
+
+    return nginx_reload()
     
 
+# Aprendizado incremental a partir das linhas NAXSI_FMT
+
+
+def parse_naxsi_payload(line):
+    # "NAXSI_FMT: ip=...&uri=/x&...&zone0=ARGS&id0=1000&var_name0=id, client: ..."
+    # "NAXSI_EXLOG: ip=...&uri=/x&id=1000&zone=ARGS&var_name=id&content=..., client: ..."
+    for marker in ("NAXSI_FMT: ", "NAXSI_EXLOG: "):
+        start = line.find(marker)
+        if start != -1:
+            break
+    else:
+        return None, None
+
+    start += len(marker)
+    end = line.find(", client: ", start)
+    fields = {}
+    for part in line[start:end if end != -1 else len(line.rstrip("\n"))].split("&"):
+        key, _, value = part.partition("=")
+        fields[key] = value
+    return marker[:-2], fields
+
+
+def parse_naxsi_fmt(line):
+    kind, fields = parse_naxsi_payload(line)
+    return fields if kind == "NAXSI_FMT" else None
+
+
+def naxsi_triplets(fields):
+    # Cada linha NAXSI_FMT pode trazer várias regras: id0/zone0/var_name0, id1/...
+    i = 0
+    while f"id{i}" in fields:
+        try:
+            yield int(fields[f"id{i}"]), fields.get(f"zone{i}", ""), fields.get(f"var_name{i}", "")
+        except ValueError:
+            pass
+        i += 1
+
+
+def naxsi_matches(fields):
+    url = fields.get("uri", "")
+    if UNSAFE_MZ_CHARS.search(url):
+        return
+    for rule_id, zone, var_name in naxsi_triplets(fields):
+        if not UNSAFE_MZ_CHARS.search(var_name):
+            yield rule_id, zone, var_name, url
+
+
+def naxsi_event(record, origin):
+    kind, fields = parse_naxsi_payload(record["message"])
+    if kind is None or record.get("ts") is None:
+        return None
+
+    if kind == "NAXSI_FMT":
+        matches = [{"id": rule_id, "zone": zone, "var_name": var_name} for rule_id, zone, var_name in naxsi_triplets(fields)]
+    else:
+        matches = [{
+            "id": int(fields["id"]) if fields.get("id", "").isdigit() else fields.get("id", ""),
+            "zone": fields.get("zone", ""),
+            "var_name": fields.get("var_name", ""),
+            "content": fields.get("content", ""),
+        }]
+
+    return {
+        "ts": record["ts"],
+        "kind": kind,
+        "origin": origin,
+        "ip": fields.get("ip", ""),
+        "server": fields.get("server", ""),
+        "uri": fields.get("uri", ""),
+        "learning": fields.get("learning") == "1",
+        "blocked": fields.get("block") == "1",
+        "matches": matches,
+    }
+
+
+@timed()
+def naxsi_events(records, origin):
+    events = []
+    for record in records:
+        event = naxsi_event(record, origin)
+        if event is not None:
+            events.append(event)
+    return events
+
+
+def match_zone(zone, var_name):
+    # ARGS + id -> $ARGS_VAR:id ; BODY|NAME + x -> $BODY_VAR:x|NAME
+    base, _, name = zone.partition("|")
+    if not var_name or base == "URL":
+        return zone
+    mz = f"${base}_VAR:{var_name}"
+    return f"{mz}|{name}" if name else mz
+
+
+class NaxsiLearner:
+    def __init__(self, log_path, state_path):
+        self.log_path = str(log_path)
+        self.state_path = Path(state_path)
+        self.counts = defaultdict(int)
+        self.offset = 0
+        self.inode = None
+        self._lock = threading.Lock()
+        self._signature = None
+
+    def _load(self):
+        # Outro worker pode ter avançado o estado; só relê se o arquivo mudou
+        signature = file_signature(self.state_path)
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self.counts = defaultdict(int)
+        self.offset, self.inode = 0, None
+        try:
+            state = json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning("Estado do aprendizado NAXSI inválido, relendo o log do início")
+            return
+
+        self.offset = state.get("offset", 0)
+        self.inode = state.get("inode")
+        for rule_id, zone, var_name, url, hits in state.get("counts", []):
+            self.counts[(rule_id, zone, var_name, url)] = hits
+
+    def _save(self):
+        state = {
+            "offset": self.offset,
+            "inode": self.inode,
+            "counts": [[*key, hits] for key, hits in self.counts.items()],
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.state_path, json.dumps(state))
+        self._signature = file_signature(self.state_path)
+
+    def update(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, file_lock(self.state_path):
+            self._load()
+
+            changed = False
+            while True:
+                try:
+                    lines, offset, inode = read_appended(self.log_path, self.offset, self.inode, NAXSI_READ_CHUNK)
+                except FileNotFoundError:
+                    break
+                if (offset, inode) == (self.offset, self.inode):
+                    break
+
+                changed = True
+                self.offset, self.inode = offset, inode
+                start = time.perf_counter()
+                for line in lines:
+                    fields = parse_naxsi_fmt(line)
+                    if fields is None:
+                        continue
+                    for key in naxsi_matches(fields):
+                        self.counts[key] += 1
+                inc("primis_log_bytes_total", sum(map(len, lines)), log="naxsi_learning")
+                inc("primis_log_lines_total", len(lines), log="naxsi_learning")
+                inc("primis_log_parse_seconds_total", time.perf_counter() - start, log="naxsi_learning")
+
+            if changed:
+                self._save()
+            return changed
+
+    def whitelist(self, pages_hit=NAXSI_PAGES_HIT, global_pages=NAXSI_GLOBAL_PAGES):
+        with self._lock:
+            grouped = defaultdict(dict)
+            for (rule_id, zone, var_name, url), hits in self.counts.items():
+                grouped[(rule_id, zone, var_name)][url] = hits
+
+        rules = []
+        for (rule_id, zone, var_name), pages in sorted(grouped.items(), key=lambda item: -sum(item[1].values())):
+            if len(pages) < pages_hit:
+                continue
+            hits = sum(pages.values())
+            mz = match_zone(zone, var_name)
+            # A zona URL só faz sentido presa à própria URL
+            if len(pages) >= global_pages and zone.partition("|")[0] != "URL":
+                rules.append(f"# {hits} hits em {len(pages)} páginas")
+                rules.append(f'BasicRule wl:{rule_id} "mz:{mz}";')
+                continue
+            for url, url_hits in sorted(pages.items(), key=lambda item: -item[1]):
+                rules.append(f"# {url_hits} hits")
+                rules.append(f'BasicRule wl:{rule_id} "mz:$URL:{url}|{mz}";')
+        return rules
+
+
+naxsi_learner = NaxsiLearner(NAXSI_LOGPATH, NAXSI_STATE_PATH)
+
+
+@cached(sources=lambda: (NAXSI_LOGPATH,))
+@timed()
 def get_optimized_rules():
-    result = subprocess.run(
+    # Lê só o que foi acrescentado desde a última chamada; o resultado fica em
+    # cache até o log mudar
+    naxsi_learner.update()
+    return naxsi_learner.whitelist()
+
+
+def get_optimized_rules_nxutil():
+    # Implementação de referência: relê o log inteiro com o nx_util
+    result = run(
         ["python3", NXUTIL_PATH, "-l", NAXSI_LOGPATH, "-o", "-p", "1"],
         check=True,
         stdout=subprocess.PIPE,
@@ -61,19 +287,10 @@ def get_optimized_rules():
 
 def save_optimized_rules():
     result = get_optimized_rules()
+    atomic_write(WHITELIST_PATH, "".join(line + "\n" for line in result))
 
-    with open(WHITELIST_PATH, "w") as f:
-        for line in result:
-            f.write(line + "\n")
-
-    nginx_reload()
+    return nginx_reload()
 
 
 def nginx_reload():
-    subprocess.run(
-        ["supervisorctl", "restart", "nginx"],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
\ No newline at end of file
+    return request_reload()
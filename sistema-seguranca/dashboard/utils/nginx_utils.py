@@ -1,7 +1,17 @@
 from pathlib import Path
 import json
-import subprocess
+import os
 import re
+import calendar
+import time
+from functools import lru_cache
+from utils.log_utils import register_log, recent_records, refresh_log, add_log_listener, logs_loaded
+from utils.insights_utils import TrafficAggregator, NaxsiAggregator, DEFAULT_WINDOW, WINDOWS
+from utils.cache_utils import cached
+from utils.reload_utils import request_reload
+from utils.fs_utils import file_lock, atomic_write
+from utils.naxsi_utils import naxsi_events
+from utils.metrics_utils import run, timed
 
 NGINX_CONF_PATH = "/etc/nginx/protected_routes.conf"
 NGINX_JSON_ROUTES_PATH = "/etc/nginx/protected_routes.json"
@@ -14,6 +24,11 @@ NGINX_NORMAL_ERROR = NGINX_LOGS_PATH / "normal_error.log"
 NGINX_PROTECTED_ACCESS = NGINX_LOGS_PATH / "protected_access.log"
 NGINX_PROTECTED_ERROR = NGINX_LOGS_PATH / "protected_error.log"
 
+# Ao iniciar, os logs dos gráficos são lidos desde o começo da maior janela
+INSIGHTS_SEED_SPAN = max(span for span, _, _ in WINDOWS.values())
+INSIGHTS_CACHE_TTL = 30
+NGINX_STATUS_TTL = 5
+
 LOCATION_TEMPLATE = """
 location {path} {{
     include /etc/nginx/naxsi.rules;
@@ -30,19 +45,38 @@ location {path} {{
 }}
 """
 
+# Modo compacto: as rotas viram poucas locations de regex (uma trie de prefixos)
+# com um único bloco de diretivas cada
+COMPACT_TEMPLATE = """
+location ~ ^{pattern} {{
+    include /etc/nginx/naxsi.rules;
+    limit_req zone=req_limit_protected burst=1;
+
+    access_log /var/log/nginx/protected_access.log;
+    error_log /var/log/nginx/protected_error.log;
+
+    if ($ssl_client_verify != SUCCESS) {{
+        return 403;
+    }}
+
+    proxy_pass http://openemr:80;
+}}
+"""
+COMPACT_CHUNK = 500
+NGINX_CONF_MODE = os.environ.get("NGINX_CONF_MODE", "template")
+
+# Mesma regex da location de arquivos estáticos do nginx.conf; no modo template
+# ela tem precedência sobre as locations de prefixo
+STATIC_LOCATION_PATTERN = re.compile(r"\.(js|css|png|jpg|jpeg|gif|ico|woff2|ttf|svg|eot)$", re.IGNORECASE)
+
 
 def reload_nginx():
-    subprocess.run(
-        ["supervisorctl", "restart", "nginx"],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
+    return request_reload()
 
 
+@cached(ttl=NGINX_STATUS_TTL)
 def nginx_alive():
-    result = subprocess.run(
+    result = run(
         ['supervisorctl', 'status', 'nginx'], 
         capture_output=True, 
         text=True,
@@ -61,148 +95,364 @@ def list_locations():
         return reader["protected_routes"]
 
 
-def create_conf_file(paths):
-    with open(NGINX_CONF_PATH, "w") as f:
-        for path in paths:
-            f.write(LOCATION_TEMPLATE.format(path=path))
+INVALID_LOCATION_CHARS = re.compile(r'[\s;{}"\'\\#$]')
+
+
+def valid_location(path):
+    return isinstance(path, str) and path.startswith("/") and not INVALID_LOCATION_CHARS.search(path)
+
+
+def analyze_locations(paths):
+    # Rotas repetidas ou cobertas por um prefixo mais curto não mudam nada no
+    # nginx; rotas com extensão estática caem na location de estáticos no modo template
+    effective = []
+    redundant = []
+    for path in sorted(paths):
+        # Em ordem lexicográfica, só o último prefixo efetivo pode cobrir a rota
+        if effective and path.startswith(effective[-1]):
+            redundant.append({"path": path, "coberta_por": effective[-1]})
+        else:
+            effective.append(path)
 
+    shadowed = [path for path in effective if STATIC_LOCATION_PATTERN.search(path)]
+    return {"efetivas": effective, "redundantes": redundant, "sombreadas": shadowed}
 
-def delete_location(path):
-    locations: list = list_locations()
-    if not path in locations:
-        return
-    locations.remove(path)
 
-    with open(NGINX_JSON_ROUTES_PATH, "w") as f:
-        json.dump({"protected_routes": locations}, f)
+def _trie_pattern(paths):
+    trie = {}
+    for path in paths:
+        node = trie
+        for char in path:
+            node = node.setdefault(char, {})
+        # Prefixo completo: tudo abaixo já é coberto
+        node.clear()
+        node[""] = True
 
-    create_conf_file(locations)
-    reload_nginx()
+    def emit(node):
+        if "" in node:
+            return ""
+        branches = []
+        for char in sorted(node):
+            child = node[char]
+            chain = re.escape(char)
+            # Junta cadeias sem bifurcação num literal só
+            while "" not in child and len(child) == 1:
+                char, child = next(iter(child.items()))
+                chain += re.escape(char)
+            branches.append(chain + emit(child))
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
 
+    return emit(trie)
+
+
+def template_conf(paths):
+    return "".join(LOCATION_TEMPLATE.format(path=path) for path in paths)
+
+
+def compact_conf(paths):
+    # As locations de regex são testadas na ordem do arquivo e o include vem
+    # antes da location de estáticos, então arquivos estáticos dentro de uma
+    # rota protegida também passam a exigir o certificado
+    effective = analyze_locations(paths)["efetivas"]
+    chunks = [effective[i:i + COMPACT_CHUNK] for i in range(0, len(effective), COMPACT_CHUNK)]
+    return "".join(COMPACT_TEMPLATE.format(pattern=_trie_pattern(chunk)) for chunk in chunks)
+
+
+CONF_GENERATORS = {
+    "template": template_conf,
+    "compacto": compact_conf,
+}
 
-def add_location(path):
-    locations: list = list_locations()
-    if path in locations:
-        return
-    locations.append(path)
 
-    with open(NGINX_JSON_ROUTES_PATH, "w") as f:
-        json.dump({"protected_routes": locations}, f)
+def create_conf_file(paths, mode=None):
+    generator = CONF_GENERATORS[mode or NGINX_CONF_MODE]
+    atomic_write(NGINX_CONF_PATH, generator(paths))
 
-    create_conf_file(locations)
-    reload_nginx()
+
+def apply_location_changes(add=(), remove=()):
+    # Aplica todas as inclusões e remoções numa única leitura/escrita do JSON,
+    # com uma única geração do .conf e um único reload
+    results = []
+    with file_lock(NGINX_JSON_ROUTES_PATH):
+        locations: list = list_locations()
+        changed = False
+
+        for path in remove:
+            if path in locations:
+                locations.remove(path)
+                changed = True
+                results.append({"path": path, "action": "remover", "status": "removido"})
+            else:
+                results.append({"path": path, "action": "remover", "status": "inexistente"})
+
+        for path in add:
+            if not valid_location(path):
+                results.append({"path": path, "action": "adicionar", "status": "inválido"})
+            elif path in locations:
+                results.append({"path": path, "action": "adicionar", "status": "existente"})
+            else:
+                locations.append(path)
+                changed = True
+                results.append({"path": path, "action": "adicionar", "status": "adicionado"})
+
+        if changed:
+            atomic_write(NGINX_JSON_ROUTES_PATH, json.dumps({"protected_routes": locations}))
+            create_conf_file(locations)
+
+    # O reload fica fora do lock para que lotes simultâneos sejam agrupados
+    reload = reload_nginx() if changed else None
+    return {"results": results, "routes": locations, "reload": reload}
+
+
+def delete_location(path):
+    # Situação da rota ("removido" ou "inexistente") com o resultado do reload
+    result = apply_location_changes(remove=[path])
+    return {**result["results"][0], "reload": result["reload"]}
+
+
+def add_location(path):
+    # "adicionado", "existente" ou "inválido", com o resultado do reload
+    result = apply_location_changes(add=[path])
+    return {**result["results"][0], "reload": result["reload"]}
 
 
 # Funções para leitura de logs
 
 
-def tail_log_file(filepath, lines=100):
-    with open(filepath, "r") as f:
-        history = f.readlines()[-lines:]
-        return history[::-1]
+ACCESS_PATTERN = re.compile(r'^(\d+\.\d+\.\d+\.\d+) .* \[(.*?)\] "(.*?) (.*?) HTTP\/.*?" (\d+) \d+ ".*?" "(.*?)"$')
+ERROR_PATTERN = re.compile(r"^(\d{4}\/\d{2}\/\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] (\d+#\d+): (.*)$")
 
+MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
 
-def parse_nginx_access(line):
-    pattern = r'^(\d+\.\d+\.\d+\.\d+) .* \[(.*?)\] "(.*?) (.*?) HTTP\/.*?" (\d+) \d+ ".*?" "(.*?)"$'
-    match = re.match(pattern, line)
-    if not match:
+BADGE_CLASSES = {
+    "error": "danger",
+    "warn": "warning",
+    "notice": "info",
+    "emerg": "purple",
+}
+
+
+@lru_cache(maxsize=1024)
+def _day_epoch(day):
+    # "dd/Mon/yyyy" -> epoch da meia-noite UTC; quase todas as linhas caem no cache
+    try:
+        return calendar.timegm((int(day[7:11]), MONTHS[day[3:6]], int(day[0:2]), 0, 0, 0))
+    except KeyError:
+        raise ValueError(f"Mês inválido: {day}")
+
+
+def parse_nginx_time(date):
+    # Formato fixo do nginx: "dd/Mon/yyyy:HH:MM:SS +zzzz"
+    if len(date) != 26 or date[11] != ":" or date[20] != " ":
+        raise ValueError(f"Data inválida: {date}")
+
+    offset = int(date[22:24]) * 3600 + int(date[24:26]) * 60
+    if date[21] == "-":
+        offset = -offset
+
+    return _day_epoch(date[:11]) + int(date[12:14]) * 3600 + int(date[15:17]) * 60 + int(date[18:20]) - offset
+
+
+class AccessBatch:
+    # Resultado colunar do parse de um bloco de linhas de acesso
+    __slots__ = ("ip", "date", "ts", "method", "url", "status", "user_agent")
+
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+
+    def __len__(self):
+        return len(self.ip)
+
+    def record(self, i):
+        return {
+            "ip": self.ip[i],
+            "date": self.date[i],
+            "ts": self.ts[i],
+            "method": self.method[i],
+            "url": self.url[i],
+            "status": self.status[i],
+            "user_agent": self.user_agent[i],
+            "is_error": self.status[i] >= 400,
+        }
+
+    def records(self):
+        return [self.record(i) for i in range(len(self))]
+
+
+def parse_error_time(date):
+    # Formato fixo do error.log: "yyyy/mm/dd HH:MM:SS", no horário local
+    return int(time.mktime((int(date[0:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]), int(date[17:19]), 0, 0, -1)))
+
+
+class ErrorBatch:
+    __slots__ = ("date", "ts", "log_type", "pid", "message")
+
+    def __init__(self):
+        for column in self.__slots__:
+            setattr(self, column, [])
+
+    def __len__(self):
+        return len(self.date)
+
+    def record(self, i):
+        log_type = self.log_type[i]
+        return {
+            "date": self.date[i],
+            "ts": self.ts[i],
+            "log_type": log_type,
+            "pid": self.pid[i],
+            "message": self.message[i],
+            "badge_class": BADGE_CLASSES.get(log_type, "secondary"),
+        }
+
+    def records(self):
+        return [self.record(i) for i in range(len(self))]
+
+
+@timed()
+def parse_access_batch(lines):
+    batch = AccessBatch()
+    match = ACCESS_PATTERN.match
+    ips, dates, stamps = batch.ip, batch.date, batch.ts
+    methods, urls, statuses, agents = batch.method, batch.url, batch.status, batch.user_agent
+
+    for line in lines:
+        m = match(line)
+        if not m:
+            continue
+        ip, date, method, url, status, user_agent = m.groups()
+        try:
+            ts = parse_nginx_time(date)
+        except ValueError:
+            ts = None
+
+        ips.append(ip)
+        dates.append(date)
+        stamps.append(ts)
+        methods.append(method)
+        urls.append(url)
+        statuses.append(int(status))
+        agents.append(user_agent)
+
+    return batch
+
+
+@timed()
+def parse_error_batch(lines):
+    batch = ErrorBatch()
+    match = ERROR_PATTERN.match
+    dates, stamps, types, pids, messages = batch.date, batch.ts, batch.log_type, batch.pid, batch.message
+
+    for line in lines:
+        m = match(line)
+        if not m:
+            continue
+        date, log_type, pid, message = m.groups()
+        dates.append(date)
+        stamps.append(parse_error_time(date))
+        types.append(log_type.lower())
+        pids.append(pid)
+        messages.append(message)
+
+    return batch
+
+
+def access_line_ts(line):
+    start = line.find("[")
+    if start < 0:
+        return None
+    try:
+        return parse_nginx_time(line[start + 1:start + 27])
+    except ValueError:
         return None
 
-    return {
-        "ip": match.group(1),
-        "date": match.group(2),
-        "method": match.group(3),
-        "url": match.group(4),
-        "status": int(match.group(5)),
-        "user_agent": match.group(6),
-        "is_error": int(match.group(5)) >= 400,
-    }
+
+def error_line_ts(line):
+    try:
+        return parse_error_time(line[:19])
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_access_records(lines):
+    return parse_access_batch(lines).records()
+
+
+def parse_error_records(lines):
+    return parse_error_batch(lines).records()
+
+
+def parse_nginx_access(line):
+    batch = parse_access_batch((line,))
+    return batch.record(0) if batch else None
 
 
 def parse_nginx_error(line):
-    pattern = r"^(\d{4}\/\d{2}\/\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] (\d+#\d+): (.*)$"
-    match = re.match(pattern, line)
-    if not match:
-        return None
+    batch = parse_error_batch((line,))
+    return batch.record(0) if batch else None
+
+
+register_log("normal_access", NGINX_NORMAL_ACCESS, batch_parser=parse_access_records, seed_since=INSIGHTS_SEED_SPAN, line_ts=access_line_ts)
+register_log("normal_errors", NGINX_NORMAL_ERROR, batch_parser=parse_error_records, seed_since=INSIGHTS_SEED_SPAN, line_ts=error_line_ts)
+register_log("protected_access", NGINX_PROTECTED_ACCESS, batch_parser=parse_access_records, seed_since=INSIGHTS_SEED_SPAN, line_ts=access_line_ts)
+register_log("protected_errors", NGINX_PROTECTED_ERROR, batch_parser=parse_error_records, seed_since=INSIGHTS_SEED_SPAN, line_ts=error_line_ts)
+register_log("server_errors", NGINX_ERROR_PATH, batch_parser=parse_error_records)
 
-    log_type = match.group(2).lower()
-    badge_class = {
-        "error": "danger",
-        "warn": "warning",
-        "notice": "info",
-        "emerg": "purple",
-    }.get(log_type, "secondary")
-
-    return {
-        "date": match.group(1),
-        "log_type": log_type,
-        "pid": match.group(3),
-        "message": match.group(4),
-        "badge_class": badge_class,
-    }
-
-
-def get_dict_logs():
-    normal_access_logs = [
-        parse_nginx_access(line) for line in tail_log_file(NGINX_NORMAL_ACCESS)
-    ]
-    normal_error_logs = [
-        parse_nginx_error(line) for line in tail_log_file(NGINX_NORMAL_ERROR)
-    ]
-    protected_access_logs = [
-        parse_nginx_access(line) for line in tail_log_file(NGINX_PROTECTED_ACCESS)
-    ]
-    protected_error_logs = [
-        parse_nginx_error(line) for line in tail_log_file(NGINX_PROTECTED_ERROR)
-    ]
-    server_error_logs = [
-        parse_nginx_error(line) for line in tail_log_file(NGINX_ERROR_PATH)
-    ]
-
-    return {
-        "normal_access": normal_access_logs,
-        "normal_errors": normal_error_logs,
-        "protected_access": protected_access_logs,
-        "protected_error": protected_error_logs,
-        "server_errors": server_error_logs,
-    }
+
+DICT_LOGS = ("normal_access", "normal_errors", "protected_access", "protected_errors", "server_errors")
+
+
+def _dict_logs_sources():
+    return (NGINX_NORMAL_ACCESS, NGINX_NORMAL_ERROR, NGINX_PROTECTED_ACCESS, NGINX_PROTECTED_ERROR, NGINX_ERROR_PATH)
+
+
+@cached(sources=_dict_logs_sources, ready=lambda: logs_loaded(*DICT_LOGS))
+def get_dict_logs(lines=100):
+    return {name: recent_records(name, lines) for name in DICT_LOGS}
 
 
 # Funções para gerar dados para os gráficos
 
 
-from datetime import datetime, timedelta, timezone
-from collections import Counter
+normal_traffic = TrafficAggregator()
+protected_traffic = TrafficAggregator()
 
-def generate_access_insights(logs):
-    time_ago = datetime.now(tz=timezone.utc) - timedelta(hours=24)
-    
-    hour_count = Counter()
-    ip_count = Counter()
-
-    for log in logs:
-        date = datetime.strptime(log["date"], "%d/%b/%Y:%H:%M:%S %z")
-        if date < time_ago:
-            break
-        date = date.strftime("%d/%m %H:00")
-        
-        ip_count[log["ip"]] += 1
-        hour_count[date] += 1
-
-    hour_labels, hour_values = zip(*sorted(hour_count.items(), key=lambda x: x[0]))
-    ip_labels, ip_values = zip(*sorted(ip_count.items(), key=lambda x: x[0]))
-    
-    return {
-        "hourly_access": {"labels": list(hour_labels), "values": list(hour_values)},
-        "ip_access": {"labels": list(ip_labels), "values": list(ip_values)},
-    }
+add_log_listener("normal_access", normal_traffic.add_records)
+add_log_listener("protected_access", protected_traffic.add_records)
 
+# Eventos do WAF dos dois logs de erro num agregado só
+naxsi_traffic = NaxsiAggregator()
 
-def get_insights():
-    normal_logs = [parse_nginx_access(line) for line in tail_log_file(NGINX_NORMAL_ACCESS, lines=9999)]
-    protected_logs = [parse_nginx_access(line) for line in tail_log_file(NGINX_PROTECTED_ACCESS, lines=9999)]
-    
-    normal = generate_access_insights(normal_logs)
-    protected = generate_access_insights(protected_logs)
-    
-    return {"normal": normal, "protected": protected}
\ No newline at end of file
+add_log_listener("normal_errors", lambda records: naxsi_traffic.add_events(naxsi_events(records, "normal")))
+add_log_listener("protected_errors", lambda records: naxsi_traffic.add_events(naxsi_events(records, "protected")))
+
+
+@cached(
+    sources=lambda: (NGINX_NORMAL_ACCESS, NGINX_PROTECTED_ACCESS), ttl=INSIGHTS_CACHE_TTL,
+    ready=lambda: logs_loaded("normal_access", "protected_access"),
+)
+@timed()
+def get_insights(window=DEFAULT_WINDOW):
+    refresh_log("normal_access")
+    refresh_log("protected_access")
+
+    normal = normal_traffic.insights(window)
+    protected = protected_traffic.insights(window)
+
+    return {"normal": normal, "protected": protected}
+
+
+@cached(
+    sources=lambda: (NGINX_NORMAL_ERROR, NGINX_PROTECTED_ERROR), ttl=INSIGHTS_CACHE_TTL,
+    ready=lambda: logs_loaded("normal_errors", "protected_errors"),
+)
+@timed()
+def get_naxsi_insights(window=DEFAULT_WINDOW):
+    refresh_log("normal_errors")
+    refresh_log("protected_errors")
+
+    return naxsi_traffic.insights(window)
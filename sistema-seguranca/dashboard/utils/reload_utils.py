@@ -0,0 +1,205 @@
+import logging
+import os
+import signal
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from utils.fs_utils import atomic_write, file_lock
+from utils.metrics_utils import inc, observe, run
+
+
+NGINX_BIN = "nginx"
+NGINX_PID_PATH = "/var/run/nginx.pid"
+
+# Arquivos alterados pelo painel; voltam para a última versão válida se o
+# "nginx -t" falhar
+MANAGED_FILES = (
+    "/etc/nginx/protected_routes.conf",
+    "/etc/nginx/protected_routes.json",
+    "/etc/nginx/generated.wl",
+    "/etc/nginx/naxsi.rules",
+)
+
+# Última versão válida de cada arquivo, compartilhada entre os workers do
+# painel; o lock do mesmo diretório serializa os reloads entre processos
+RELOAD_STATE_PATH = Path("/run/primislayer/nginx")
+
+# Alterações em sequência dentro dessa janela viram um único reload
+RELOAD_DEBOUNCE = 0.5
+RELOAD_MAX_DELAY = 5.0
+RELOAD_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_apply_lock = threading.Lock()
+_pending = None
+_history = deque(maxlen=50)
+
+
+class _PendingReload:
+    def __init__(self):
+        self.created = time.monotonic()
+        self.requests = 0
+        self.timer = None
+        self.taken = False
+        self.event = threading.Event()
+        self.result = None
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _snapshot_path(path):
+    return RELOAD_STATE_PATH / path.strip("/").replace("/", "_")
+
+
+def _current_contents():
+    return {path: _read(path) for path in MANAGED_FILES}
+
+
+def _save_snapshot(contents=None):
+    RELOAD_STATE_PATH.mkdir(parents=True, exist_ok=True)
+    contents = _current_contents() if contents is None else contents
+    for path, content in contents.items():
+        if content is None:
+            _snapshot_path(path).unlink(missing_ok=True)
+        elif _read(_snapshot_path(path)) != content:
+            atomic_write(_snapshot_path(path), content)
+
+
+def snapshot_config():
+    # Guarda o conteúdo atual como a última versão válida, só se o nginx -t
+    # aceitar: uma configuração deixada quebrada não pode virar o ponto de
+    # volta dos rollbacks
+    RELOAD_STATE_PATH.mkdir(parents=True, exist_ok=True)
+    with file_lock(RELOAD_STATE_PATH / "reload"):
+        before = _current_contents()
+        try:
+            test = run([NGINX_BIN, "-t"], capture_output=True, text=True)
+        except OSError as e:
+            logger.warning("Configuração do nginx não testada, snapshot mantido: %s", e)
+            return False
+        if test.returncode != 0:
+            logger.warning("Configuração atual do nginx inválida, snapshot mantido: %s", test.stderr.strip())
+            return False
+        _save_snapshot(_tested_contents(before))
+        return True
+
+
+def _tested_contents(before):
+    # Quem altera os arquivos não segura o lock do reload: o que mudou durante
+    # o "nginx -t" não foi necessariamente testado e tem o próprio reload na fila
+    return {path: content for path, content in before.items() if _read(path) == content}
+
+
+def _rollback(tested):
+    # Só volta os arquivos que ainda estão como foram testados, para não
+    # desfazer a alteração de outro pedido gravada nesse meio tempo
+    restored = False
+    for path, tested_content in tested.items():
+        content = _read(_snapshot_path(path))
+        if content is None or _read(path) != tested_content:
+            continue
+        restored = True
+        if tested_content != content:
+            atomic_write(path, content)
+    return restored
+
+
+def _nginx_pid():
+    try:
+        with open(NGINX_PID_PATH, "r") as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return pid
+    except (FileNotFoundError, ValueError, ProcessLookupError, PermissionError):
+        return None
+
+
+def apply_reload():
+    RELOAD_STATE_PATH.mkdir(parents=True, exist_ok=True)
+    with _apply_lock, file_lock(RELOAD_STATE_PATH / "reload"):
+        start = time.perf_counter()
+        result = {"status": "ok", "rolled_back": False}
+
+        before = _current_contents()
+        test = run([NGINX_BIN, "-t"], capture_output=True, text=True)
+        tested = _tested_contents(before)
+        if test.returncode != 0:
+            result["status"] = "erro"
+            result["error"] = test.stderr.strip()
+            result["rolled_back"] = _rollback(tested)
+        else:
+            _save_snapshot(tested)
+            pid = _nginx_pid()
+            if pid is None:
+                # nginx parado pelo painel: a configuração já validada vale no próximo start
+                result["status"] = "validado"
+            else:
+                # HUP: o master relê a configuração e troca os workers sem
+                # derrubar as conexões em andamento
+                os.kill(pid, signal.SIGHUP)
+
+        elapsed = time.perf_counter() - start
+        observe("primis_nginx_reload_seconds", elapsed, status=result["status"])
+        result["duration_ms"] = round(elapsed * 1000, 1)
+        result["time"] = int(time.time())
+        _history.append(result)
+        return result
+
+
+def _run_pending(pending):
+    global _pending
+    with _lock:
+        # Um timer cancelado pode já ter disparado; só o primeiro aplica
+        if pending.taken:
+            return
+        pending.taken = True
+        if _pending is pending:
+            _pending = None
+
+    try:
+        pending.result = apply_reload()
+    except Exception as e:
+        pending.result = {"status": "erro", "error": str(e), "rolled_back": False}
+    pending.result["coalesced"] = pending.requests
+    pending.event.set()
+
+
+def request_reload(wait=True, timeout=RELOAD_TIMEOUT):
+    global _pending
+    with _lock:
+        if _pending is None:
+            _pending = _PendingReload()
+        pending = _pending
+        pending.requests += 1
+        inc("primis_nginx_reload_requests_total")
+
+        if pending.timer is not None:
+            pending.timer.cancel()
+        delay = RELOAD_DEBOUNCE
+        # Não adia para sempre se as alterações não pararem de chegar
+        if time.monotonic() - pending.created >= RELOAD_MAX_DELAY:
+            delay = 0
+        pending.timer = threading.Timer(delay, _run_pending, args=(pending,))
+        pending.timer.daemon = True
+        pending.timer.start()
+
+    if not wait:
+        return {"status": "agendado"}
+
+    if not pending.event.wait(timeout):
+        return {"status": "erro", "error": "Tempo esgotado aguardando o reload", "rolled_back": False}
+    return pending.result
+
+
+def reload_history():
+    return list(_history)
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+from collections import deque
+from utils.log_utils import add_log_listener
+
+
+STREAM_TABLES = (
+    "normal_access",
+    "normal_errors",
+    "protected_access",
+    "protected_errors",
+    "server_errors",
+    "fail2ban",
+    "certs",
+)
+STREAM_BUFFER_SIZE = 500
+HEARTBEAT_INTERVAL = 15
+# Cada conexão ocupa uma thread do worker (gthread) enquanto a aba estiver
+# aberta; acima do limite o /stream responde 503 e a página passa a consultar
+# o /stream/recentes, deixando threads livres para o resto do painel
+STREAM_MAX_CLIENTS = int(os.environ.get("DASHBOARD_STREAMS", max(int(os.environ.get("DASHBOARD_THREADS", "8")) // 2, 1)))
+
+
+class StreamClient:
+    # Fila limitada por navegador: se o cliente não acompanhar, os eventos mais
+    # antigos são descartados em vez de acumular memória no servidor
+    def __init__(self, tables, ip=None, maxsize=STREAM_BUFFER_SIZE):
+        self.tables = set(tables)
+        self.ip = ip
+        self.dropped = 0
+        self._events = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+
+    def accepts(self, table, record):
+        if table not in self.tables:
+            return False
+        if self.ip and isinstance(record, dict) and record.get("ip") != self.ip:
+            return False
+        return True
+
+    def push(self, table, record):
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append((table, record))
+            self._cond.notify()
+
+    def pop_all(self, timeout):
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            dropped, self.dropped = self.dropped, 0
+            return events, dropped
+
+
+_clients = set()
+_clients_lock = threading.Lock()
+
+
+def subscribe(tables, ip=None):
+    client = StreamClient(tables, ip=ip)
+    with _clients_lock:
+        if len(_clients) >= STREAM_MAX_CLIENTS:
+            return None
+        _clients.add(client)
+    return client
+
+
+def unsubscribe(client):
+    with _clients_lock:
+        _clients.discard(client)
+
+
+def publish(table, records):
+    with _clients_lock:
+        clients = list(_clients)
+    for client in clients:
+        for record in records:
+            if client.accepts(table, record):
+                client.push(table, record)
+
+
+def _listener(table):
+    return lambda records: publish(table, records)
+
+
+def start_streaming():
+    for table in STREAM_TABLES:
+        add_log_listener(table, _listener(table))
+
+
+def client_count():
+    with _clients_lock:
+        return len(_clients)
+
+
+def sse_events(client):
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            events, dropped = client.pop_all(HEARTBEAT_INTERVAL)
+            if not events and not dropped:
+                yield ": ping\n\n"
+                continue
+            if dropped:
+                yield f"event: dropped\ndata: {dropped}\n\n"
+            for table, record in events:
+                yield f"event: {table}\ndata: {json.dumps(record)}\n\n"
+    finally:
+        unsubscribe(client)
@@ -0,0 +1,96 @@
+import heapq
+
+
+TOPK_CAPACITY = 100
+
+
+class SpaceSaving:
+    # Top-K aproximado em memória fixa (algoritmo Space-Saving): guarda no
+    # máximo "capacity" chaves; ao entrar uma chave nova com a tabela cheia,
+    # ela herda a contagem da menor, que vira o erro máximo daquela chave.
+    # A contagem real fica sempre entre count - error e count.
+    __slots__ = ("capacity", "counts", "errors", "total", "_heap")
+
+    def __init__(self, capacity=TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key, count=1):
+        self.total += count
+        counts = self.counts
+
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+        else:
+            victim, floor = self._pop_min()
+            del counts[victim]
+            del self.errors[victim]
+            counts[key] = floor + count
+            self.errors[key] = floor
+
+        heapq.heappush(self._heap, (counts[key], key))
+        # Entradas antigas ficam no heap até serem descartadas; reconstrói
+        # quando ele cresce demais
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._heap = [(c, k) for k, c in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        heap = self._heap
+        while True:
+            count, key = heapq.heappop(heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def min_count(self):
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other):
+        # Soma dois resumos; uma chave ausente num resumo cheio pode ter tido
+        # até o mínimo dele, que entra como erro
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        merged.total = self.total + other.total
+        self_min, other_min = self.min_count(), other.min_count()
+
+        counts = {}
+        errors = {}
+        for key in self.counts.keys() | other.counts.keys():
+            count = error = 0
+            for summary, floor in ((self, self_min), (other, other_min)):
+                if key in summary.counts:
+                    count += summary.counts[key]
+                    error += summary.errors[key]
+                else:
+                    count += floor
+                    error += floor
+            counts[key] = count
+            errors[key] = error
+
+        for key in heapq.nlargest(merged.capacity, counts, key=counts.get):
+            merged.counts[key] = counts[key]
+            merged.errors[key] = errors[key]
+        merged._heap = [(c, k) for k, c in merged.counts.items()]
+        heapq.heapify(merged._heap)
+        return merged
+
+    def top(self, n=10):
+        keys = heapq.nlargest(n, self.counts, key=self.counts.get)
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+
+def merge_all(summaries, capacity=TOPK_CAPACITY):
+    result = SpaceSaving(capacity)
+    for summary in summaries:
+        result = result.merge(summary)
+    return result
@@ -1,4 +1,4 @@
-CA_DIR="../data/ssl"
+CA_DIR="${CA_DIR:-../data/ssl}"
 
 # Criar estrutura de pastas
 mkdir -p "$CA_DIR"/{ca,server,clients}
@@ -37,6 +37,7 @@ private_key       = \$dir/ca.key
 serial            = \$dir/serial
 crlnumber         = \$dir/crlnumber
 default_md        = sha256
+default_crl_days  = 30
 policy            = policy_any
 
 [ policy_any ]